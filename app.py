@@ -1,25 +1,85 @@
-from fastapi import FastAPI
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from ingestion.ingest_service import ingest_repo_service
-from generation.generate_service import generate_service
+from ingestion.jobs import get_job_queue
+from generation.generate_service import agenerate_service, agenerate_stream
+from resources import warm_up, is_ready, warm_up_error
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # load models in the background so /ready can report progress
+    warm_task = asyncio.create_task(asyncio.to_thread(warm_up))
+    # resumes jobs still queued from a previous run
+    jobs = get_job_queue()
+    yield
+    warm_task.cancel()
+    jobs.shutdown()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 class IngestRequest(BaseModel):
     repo_url: str
+    incremental: bool = True
+    revision: str | None = None  # commit sha to ingest instead of HEAD
 
 
 class GenerateRequest(BaseModel):
     prompt: str
     repo_url: str | None = None
+    path_prefix: str | None = None
 
 
-@app.post("/ingest")
+@app.get("/ready")
+def ready_api(response: Response):
+    if not is_ready():
+        response.status_code = 503
+        error = warm_up_error()
+        if error is not None:
+            return {"status": "failed", "error": error}
+        return {"status": "warming_up"}
+    return {"status": "ready"}
+
+
+@app.post("/ingest", status_code=202)
 def ingest_api(req: IngestRequest):
-    return ingest_repo_service(req.repo_url)
+    job_id = get_job_queue().submit(req.repo_url, req.incremental, req.revision)
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.get("/ingest/{job_id}")
+def ingest_status_api(job_id: str):
+    job = get_job_queue().status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+
+@app.delete("/ingest/{job_id}")
+def ingest_cancel_api(job_id: str):
+    if get_job_queue().status(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    if not get_job_queue().cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job is not queued or running")
+    return {"job_id": job_id, "status": "cancelling"}
 
 
 @app.post("/generate_tests")
-def generate_api(req: GenerateRequest):
-    return generate_service(req.prompt, req.repo_url)
+async def generate_api(req: GenerateRequest):
+    return await agenerate_service(req.prompt, req.repo_url, req.path_prefix)
+
+
+
+@app.post("/generate_tests/stream")
+async def generate_stream_api(req: GenerateRequest):
+    async def ndjson():
+        async for event in agenerate_stream(req.prompt, req.repo_url, req.path_prefix):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
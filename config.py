@@ -6,8 +6,55 @@ load_dotenv()
 DB_URL = os.getenv("DATABASE_URL")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")  # good free Groq model
+GROQ_TEMPERATURE = float(os.getenv("GROQ_TEMPERATURE", "0"))
 HF_EMBED_MODEL = os.getenv("HF_EMBED_MODEL")
 CLONE_BASE = os.getenv("CLONE_BASE", "/tmp/repos")
+CLONE_DEPTH = int(os.getenv("CLONE_DEPTH", "1"))  # 0 = full history
+CLONE_FILTER = os.getenv("CLONE_FILTER", "blob:none")  # partial clone filter, empty disables
+CLONE_SPARSE = os.getenv("CLONE_SPARSE", "true").lower() == "true"  # check out only ingested file types
+CLONE_CACHE = os.getenv("CLONE_CACHE", "false").lower() == "true"  # shared bare object cache across URLs
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(CLONE_BASE, "embed_cache.sqlite"))
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "500000"))  # 0 disables the cache
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", str(os.cpu_count() or 1)))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))  # nodes embedded/inserted per batch
+PG_COPY_BATCH_SIZE = int(os.getenv("PG_COPY_BATCH_SIZE", "1000"))  # rows per COPY transaction
+PG_COPY_MAX_PENDING = int(os.getenv("PG_COPY_MAX_PENDING", "4"))  # queued batches before embedding blocks
+ANN_INDEX_TYPE = os.getenv("ANN_INDEX_TYPE", "hnsw")  # hnsw | ivfflat | none
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "0"))  # 0 = derive from row count
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+ANN_ITERATIVE_SCAN = os.getenv("ANN_ITERATIVE_SCAN", "relaxed_order")  # off | relaxed_order | strict_order, filtered searches (pgvector >= 0.8)
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "vector")  # vector | halfvec | binary, precision of the ANN index
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "10"))  # quantized candidates per result, re-scored at full precision
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "16384"))  # padded tokens per model forward pass
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "64"))  # texts per forward pass, whatever their length
+EMBED_TORCH_THREADS = int(os.getenv("EMBED_TORCH_THREADS", "0"))  # torch intra-op threads, 0 = torch default
+EMBED_EXECUTOR_WORKERS = int(os.getenv("EMBED_EXECUTOR_WORKERS", "2"))  # threads embedding queries for async requests
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "2"))  # repos ingested in parallel
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(CLONE_BASE, "jobs.sqlite"))
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "1024"))  # query text -> embedding
+QUERY_RESULT_CACHE_SIZE = int(os.getenv("QUERY_RESULT_CACHE_SIZE", "1024"))  # search results, 0 disables
+QUERY_RESULT_CACHE_TTL = float(os.getenv("QUERY_RESULT_CACHE_TTL", "300"))  # seconds
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(CLONE_BASE, "llm_cache.sqlite"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))  # 0 disables; only used at temperature 0
+ROBOT_WORKERS = int(os.getenv("ROBOT_WORKERS", str(os.cpu_count() or 1)))  # robot shards running at once, process-wide
+ROBOT_SHARD_TIMEOUT = float(os.getenv("ROBOT_SHARD_TIMEOUT", "300"))  # seconds per suite
+ROBOT_RUNS_DIR = os.getenv("ROBOT_RUNS_DIR", os.path.join(CLONE_BASE, "robot_runs"))  # one subdirectory per generate request
+ROBOT_RUNS_KEEP = int(os.getenv("ROBOT_RUNS_KEEP", "50"))  # newest run directories kept, 0 keeps all
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", HF_EMBED_MODEL)  # HF tokenizer closest to the LLM's
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # max tokens of retrieved code per prompt
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "6"))  # hits retrieved before merging/packing
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"  # fuse full-text hits into retrieval
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "30"))  # per-retriever candidates before fusion/rerank
+RERANK_MODEL = os.getenv("RERANK_MODEL", "")  # e.g. cross-encoder/ms-marco-MiniLM-L-6-v2; empty disables
+SYMBOL_LOOKUP_LIMIT = int(os.getenv("SYMBOL_LOOKUP_LIMIT", "5"))  # defining chunks added per query
+MAX_FILE_BYTES = int(os.getenv("MAX_FILE_BYTES", str(1024 * 1024)))  # larger files are skipped at ingest
+INGEST_EXCLUDE_DIRS = set(os.getenv(
+    "INGEST_EXCLUDE_DIRS",
+    "venv,.venv,node_modules,site-packages,vendor,_vendor,third_party,__pycache__,.tox,.nox,.eggs",
+).split(","))
 rules_path = os.path.join(os.path.dirname(__file__), "prompt_rules.txt")
 prompt_rules = open(rules_path, "r", encoding="utf-8").read()
 
@@ -13,8 +13,8 @@ def main():
     """
     Demonstrate embedding visualization capabilities.
     """
-    # Initialize visualizer
-    visualizer = EmbeddingVisualizer()
+    # Initialize visualizer; fits are persisted so re-runs skip the PCA/t-SNE
+    visualizer = EmbeddingVisualizer(reduction_cache_dir='.reduction_cache')
     
     # Load embeddings from TSV file
     logger.info("Loading embeddings from file...")
@@ -47,7 +47,7 @@ def main():
     # Create 3D visualization only if we have enough samples
     num_samples = len(visualizer.embeddings_df)
     if num_samples >= 3:
-        # Reduce to 3D for 3D visualization
+        # Reduce to 3D for 3D visualization; reuses the PCA fit from the 2D step
         logger.info("\nReducing dimensions with PCA (3D)...")
         visualizer.reduce_dimensions(method='pca', n_components=3)
         
@@ -60,9 +60,15 @@ def main():
     else:
         logger.info(f"\nSkipping 3D visualization (need at least 3 samples, have {num_samples})")
     
+    # Near-duplicate chunks, from a blockwise scan of the full set
+    if num_samples >= 2:
+        logger.info("\nFinding near-duplicate chunks...")
+        visualizer.find_neighbors(k=10)
+        print(visualizer.duplicate_report().head(20))
+    
     # Create similarity heatmap
     logger.info("\nCreating similarity heatmap...")
-    sample_size = min(50, num_samples)  # Use actual number if less than 50
+    sample_size = min(200, num_samples)  # Use actual number if less than 200
     visualizer.plot_heatmap(
         sample_size=sample_size,
         title="Embedding Similarity Matrix",
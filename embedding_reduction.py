@@ -0,0 +1,227 @@
+"""
+Dimensionality reduction for embedding visualization.
+Fits are cached per dataset so 2D and 3D views (and repeated calls) share
+one PCA fit, and new points can be projected into an existing layout.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from sklearn.decomposition import PCA, IncrementalPCA
+from sklearn.manifold import TSNE
+from sklearn.neighbors import NearestNeighbors
+
+logger = logging.getLogger(__name__)
+
+# Above this many rows PCA switches from an exact SVD to a randomized one
+RANDOMIZED_PCA_ROWS = 20000
+# Above this many rows (or for memory-mapped input) PCA is fitted in batches
+INCREMENTAL_PCA_ROWS = 200000
+INCREMENTAL_BATCH_ROWS = 10000
+# Components kept by the shared PCA fit; t-SNE runs on these
+PCA_DIMS = 50
+
+
+def data_hash(embeddings: np.ndarray) -> str:
+    """
+    Content hash of an embedding matrix, used as the cache key for fits.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str((embeddings.shape, embeddings.dtype.str)).encode())
+    step = INCREMENTAL_BATCH_ROWS
+    # hashed in row blocks so memory-mapped input is never loaded whole
+    for start in range(0, embeddings.shape[0], step):
+        h.update(np.ascontiguousarray(embeddings[start:start + step]).data)
+    return h.hexdigest()
+
+
+class ReductionEngine:
+    """
+    PCA / PCA->t-SNE reduction with per-dataset caching.
+
+    Every dataset gets a single PCA fit to PCA_DIMS components: PCA views use
+    its leading components, t-SNE runs on the full PCA_DIMS projection with
+    the Barnes-Hut approximation. Results are kept in memory and, when
+    `cache_dir` is set, on disk.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, random_state: int = 42):
+        """
+        Initialize the engine.
+
+        Args:
+            cache_dir: Optional directory to persist fits and layouts in
+            random_state: Seed for randomized PCA and t-SNE
+        """
+        self.cache_dir = cache_dir
+        self.random_state = random_state
+        self._pca: Dict[str, Tuple[object, np.ndarray]] = {}
+        self._layouts: Dict[Tuple[str, str, int], np.ndarray] = {}
+        # (method, n_components) -> data hash of the most recent layout
+        self._latest: Dict[Tuple[str, int], str] = {}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_file(self, key: str, suffix: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        # fits depend on the seed and the PCA width as well as the data
+        return os.path.join(self.cache_dir, f"{key}_pca{PCA_DIMS}_seed{self.random_state}_{suffix}")
+
+    @staticmethod
+    def _fit_incremental(pca, embeddings: np.ndarray) -> None:
+        # partial_fit block by block: fit() would copy the whole matrix.
+        # Every block needs >= n_components rows, so a short tail joins the
+        # block before it.
+        n_rows, step = embeddings.shape[0], INCREMENTAL_BATCH_ROWS
+        starts = list(range(0, n_rows, step))
+        if len(starts) > 1 and n_rows - starts[-1] < pca.n_components:
+            starts.pop()
+        for i, start in enumerate(starts):
+            stop = starts[i + 1] if i + 1 < len(starts) else n_rows
+            pca.partial_fit(np.asarray(embeddings[start:stop], dtype=np.float32))
+
+    def _make_pca(self, n_rows: int, n_components: int, memmapped: bool):
+        if memmapped or n_rows > INCREMENTAL_PCA_ROWS:
+            return IncrementalPCA(n_components=n_components,
+                                  batch_size=max(INCREMENTAL_BATCH_ROWS, n_components))
+        if n_rows > RANDOMIZED_PCA_ROWS:
+            return PCA(n_components=n_components, svd_solver='randomized',
+                       random_state=self.random_state)
+        return PCA(n_components=n_components)
+
+    def _fit_pca(self, embeddings: np.ndarray, key: str) -> Tuple[object, np.ndarray]:
+        if key in self._pca:
+            return self._pca[key]
+
+        path = self._cache_file(key, "pca.pkl")
+        if path and os.path.exists(path):
+            with open(path, 'rb') as fh:
+                self._pca[key] = pickle.load(fh)
+            self._pca[key][1].setflags(write=False)
+            return self._pca[key]
+
+        n_rows, dims = embeddings.shape
+        n_components = min(PCA_DIMS, n_rows, dims)
+        pca = self._make_pca(n_rows, n_components, isinstance(embeddings, np.memmap))
+        logger.info(f"Fitting {type(pca).__name__} ({n_components} components) on {n_rows} rows...")
+        if isinstance(pca, IncrementalPCA):
+            self._fit_incremental(pca, embeddings)
+        else:
+            pca.fit(embeddings)
+        projected = self._transform(pca, embeddings)
+        # shared by every view of this dataset, so nobody may write to it
+        projected.setflags(write=False)
+
+        self._pca[key] = (pca, projected)
+        if path:
+            with open(path, 'wb') as fh:
+                pickle.dump(self._pca[key], fh)
+        return self._pca[key]
+
+    @staticmethod
+    def _transform(pca, embeddings: np.ndarray) -> np.ndarray:
+        # in row blocks, so a memory-mapped matrix is never copied whole
+        step = INCREMENTAL_BATCH_ROWS
+        return np.vstack([
+            pca.transform(embeddings[start:start + step]).astype(np.float32)
+            for start in range(0, embeddings.shape[0], step)
+        ])
+
+    def _tsne(self, projected: np.ndarray, n_components: int) -> np.ndarray:
+        n_rows = projected.shape[0]
+        # perplexity has to stay below the number of samples
+        perplexity = min(30.0, max(n_rows - 1, 1) / 3)
+        logger.info(f"Running Barnes-Hut t-SNE on {n_rows} x {projected.shape[1]}...")
+        return TSNE(
+            n_components=n_components,
+            method='barnes_hut',
+            init='pca',
+            perplexity=perplexity,
+            random_state=self.random_state,
+        ).fit_transform(projected).astype(np.float32)
+
+    def reduce(self, embeddings: np.ndarray, method: str = 'pca', n_components: int = 2) -> np.ndarray:
+        """
+        Reduce embeddings to `n_components` dimensions.
+
+        Args:
+            embeddings: (n, dim) matrix, may be memory-mapped
+            method: 'pca' or 'tsne'
+            n_components: Number of dimensions to reduce to (2 or 3)
+
+        Returns:
+            Reduced embeddings array (a copy; the cached layout is read-only)
+        """
+        method = method.lower()
+        if method not in ('pca', 'tsne'):
+            raise ValueError("Method must be 'pca' or 'tsne'")
+
+        key = data_hash(embeddings)
+        self._latest[(method, n_components)] = key
+        layout_key = (key, method, n_components)
+        if layout_key in self._layouts:
+            logger.info(f"Using cached {method} layout")
+            return self._layouts[layout_key].copy()
+
+        pca, projected = self._fit_pca(embeddings, key)
+        if n_components > projected.shape[1]:
+            raise ValueError(f"Cannot reduce {embeddings.shape[0]} samples to {n_components} dimensions")
+
+        if method == 'pca':
+            logger.info(f"Explained variance: {pca.explained_variance_ratio_[:n_components]}")
+            layout = projected[:, :n_components]
+        else:
+            path = self._cache_file(key, f"tsne{n_components}.npy")
+            if path and os.path.exists(path):
+                layout = np.load(path)
+            else:
+                layout = self._tsne(projected, n_components)
+                if path:
+                    np.save(path, layout)
+
+        layout.setflags(write=False)
+        self._layouts[layout_key] = layout
+        # callers get their own copy; the cached layout stays intact
+        return layout.copy()
+
+    def project(self, new_embeddings: np.ndarray, method: str = 'pca', n_components: int = 2,
+                n_neighbors: int = 10) -> np.ndarray:
+        """
+        Place new points into the most recent layout for (method, n_components)
+        without refitting it.
+
+        PCA layouts apply the fitted projection directly. t-SNE has no
+        out-of-sample transform, so each new point is put at the
+        distance-weighted mean of its nearest fitted neighbours (in the
+        shared PCA space).
+
+        Args:
+            new_embeddings: (m, dim) matrix with the same dim as the fitted data
+            method: 'pca' or 'tsne'
+            n_components: Dimensions of the layout to project into
+            n_neighbors: Neighbours used to place points in a t-SNE layout
+
+        Returns:
+            (m, n_components) coordinates in the existing layout
+        """
+        method = method.lower()
+        key = self._latest.get((method, n_components))
+        if key is None:
+            raise ValueError(f"No {method} layout with {n_components} components yet. Call reduce first.")
+        pca, projected = self._pca[key]
+        new_projected = self._transform(pca, np.asarray(new_embeddings, dtype=np.float32))
+
+        if method == 'pca':
+            return new_projected[:, :n_components]
+
+        layout = self._layouts[(key, method, n_components)]
+        nn = NearestNeighbors(n_neighbors=min(n_neighbors, projected.shape[0])).fit(projected)
+        distances, indices = nn.kneighbors(new_projected)
+        weights = 1.0 / np.maximum(distances, 1e-6)
+        weights /= weights.sum(axis=1, keepdims=True)
+        return np.einsum('mk,mkc->mc', weights, layout[indices]).astype(np.float32)
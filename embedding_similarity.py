@@ -0,0 +1,170 @@
+"""
+Blockwise cosine similarity over an embedding matrix.
+Scans the full set in tiles with bounded memory to find each chunk's nearest
+neighbours and clusters of near-duplicate chunks.
+"""
+
+import logging
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import leaves_list, linkage
+
+logger = logging.getLogger(__name__)
+
+# Rows per tile; a tile pair costs BLOCK_ROWS^2 float32 scores
+BLOCK_ROWS = 2048
+# Cosine similarity at or above which two chunks count as duplicates
+DUPLICATE_THRESHOLD = 0.98
+
+
+def row_norms(embeddings: np.ndarray, block_rows: int = BLOCK_ROWS) -> np.ndarray:
+    """
+    L2 norm of every row, computed a block at a time (zero rows get 1).
+    """
+    norms = np.empty(embeddings.shape[0], dtype=np.float32)
+    for start in range(0, embeddings.shape[0], block_rows):
+        block = np.asarray(embeddings[start:start + block_rows], dtype=np.float32)
+        norms[start:start + block_rows] = np.linalg.norm(block, axis=1)
+    norms[norms == 0] = 1.0
+    return norms
+
+
+def _normalized_block(embeddings: np.ndarray, norms: np.ndarray, start: int, stop: int) -> np.ndarray:
+    return np.asarray(embeddings[start:stop], dtype=np.float32) / norms[start:stop, None]
+
+
+def top_k_neighbors(embeddings: np.ndarray, k: int = 10,
+                    block_rows: int = BLOCK_ROWS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact top-k cosine neighbours of every row, excluding itself.
+
+    Rows are normalized tile by tile and scored with float32 matmuls; each
+    query tile keeps a running top-k as it sweeps the key tiles, so memory
+    is O(block_rows * (block_rows + k)) on top of the (n, k) result, and a
+    memory-mapped matrix is never loaded whole.
+
+    Args:
+        embeddings: (n, dim) matrix, may be memory-mapped
+        k: Neighbours per row
+        block_rows: Rows per tile
+
+    Returns:
+        (indices, scores), both (n, k), sorted by descending similarity
+    """
+    n = embeddings.shape[0]
+    k = min(k, n - 1)
+    if k <= 0:
+        raise ValueError("Need at least 2 embeddings to find neighbours")
+    norms = row_norms(embeddings, block_rows)
+    indices = np.empty((n, k), dtype=np.int64)
+    scores = np.empty((n, k), dtype=np.float32)
+
+    for q_start in range(0, n, block_rows):
+        q_stop = min(q_start + block_rows, n)
+        queries = _normalized_block(embeddings, norms, q_start, q_stop)
+        best_scores = np.full((q_stop - q_start, k), -np.inf, dtype=np.float32)
+        best_idx = np.full((q_stop - q_start, k), -1, dtype=np.int64)
+
+        for k_start in range(0, n, block_rows):
+            k_stop = min(k_start + block_rows, n)
+            if k_start == q_start:
+                keys = queries
+            else:
+                keys = _normalized_block(embeddings, norms, k_start, k_stop)
+            sims = queries @ keys.T
+            if k_start == q_start:
+                np.fill_diagonal(sims, -np.inf)
+
+            # merge this tile into the running top-k
+            cand_scores = np.concatenate([best_scores, sims], axis=1)
+            cand_idx = np.concatenate(
+                [best_idx, np.broadcast_to(np.arange(k_start, k_stop), sims.shape)], axis=1
+            )
+            top = np.argpartition(-cand_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(cand_scores, top, axis=1)
+            best_idx = np.take_along_axis(cand_idx, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        scores[q_start:q_stop] = np.take_along_axis(best_scores, order, axis=1)
+        indices[q_start:q_stop] = np.take_along_axis(best_idx, order, axis=1)
+        logger.info(f"Scored {q_stop}/{n} rows")
+
+    return indices, scores
+
+
+def duplicate_clusters(indices: np.ndarray, scores: np.ndarray,
+                       threshold: float = DUPLICATE_THRESHOLD) -> List[List[int]]:
+    """
+    Groups rows whose neighbour similarity is >= threshold (union-find over
+    the top-k graph). Returns clusters of 2+ rows, largest first.
+    """
+    parent = np.arange(indices.shape[0])
+
+    def find(i):
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    for i, j in zip(*np.nonzero(scores >= threshold)):
+        a, b = find(i), find(indices[i, j])
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    roots = np.array([find(i) for i in range(len(parent))])
+    clusters = {}
+    for i, root in enumerate(roots):
+        clusters.setdefault(root, []).append(i)
+    return sorted((c for c in clusters.values() if len(c) > 1), key=len, reverse=True)
+
+
+def duplicate_report(clusters: List[List[int]], metadata: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    One row per chunk in a duplicate cluster, with its metadata if given
+    (e.g. node_id, file_path from load_embeddings_from_db).
+    """
+    rows = [(cluster_id, len(c), i) for cluster_id, c in enumerate(clusters) for i in c]
+    report = pd.DataFrame(rows, columns=['cluster', 'cluster_size', 'row'])
+    if metadata is not None and len(report):
+        report = pd.concat(
+            [report, metadata.iloc[report['row']].reset_index(drop=True)], axis=1
+        )
+    return report
+
+
+def heatmap_sample(embeddings: np.ndarray, sample_size: int,
+                   clusters: Optional[List[List[int]]] = None,
+                   random_state: int = 42) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Picks rows for a similarity heatmap and orders them so similar rows sit
+    together (average-linkage on cosine distance).
+
+    Up to half the sample comes from duplicate clusters, so redundancy is
+    visible; the rest is a uniform random sample.
+
+    Returns:
+        (rows, similarity matrix of those rows in that order)
+    """
+    n = embeddings.shape[0]
+    sample_size = min(sample_size, n)
+    rng = np.random.default_rng(random_state)
+
+    chosen = []
+    for c in clusters or []:
+        if len(chosen) + len(c) > sample_size // 2:
+            continue
+        chosen.extend(c)
+    rest = np.setdiff1d(np.arange(n), chosen)
+    chosen.extend(rng.choice(rest, size=sample_size - len(chosen), replace=False).tolist())
+    rows = np.sort(np.array(chosen, dtype=np.int64))
+
+    sample = np.asarray(embeddings[rows], dtype=np.float32)
+    sample /= np.maximum(np.linalg.norm(sample, axis=1, keepdims=True), 1e-12)
+    if len(rows) > 2:
+        order = leaves_list(linkage(sample, method='average', metric='cosine'))
+        rows, sample = rows[order], sample[order]
+    return rows, sample @ sample.T
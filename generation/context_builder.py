@@ -0,0 +1,126 @@
+"""
+Turns retrieved hits into the context block sent to the LLM.
+
+  1. chunks from the same file whose line ranges overlap or touch are merged
+     (the chunker overlaps neighbours by 20 lines)
+  2. near-duplicates (vendored copies, boilerplate) are dropped
+  3. the most relevant segments are packed into a token budget
+  4. what's kept is ordered by file and position
+"""
+import re
+from functools import lru_cache
+
+from transformers import AutoTokenizer
+
+from config import CONTEXT_TOKENIZER, CONTEXT_TOKEN_BUDGET
+
+NEAR_DUPLICATE_JACCARD = 0.9
+
+
+@lru_cache(maxsize=1)
+def get_context_tokenizer():
+    return AutoTokenizer.from_pretrained(CONTEXT_TOKENIZER)
+
+
+def count_tokens(text: str) -> int:
+    return len(get_context_tokenizer().encode(text, add_special_tokens=False))
+
+
+def _segments(hits):
+    """
+    One segment per hit. Hits arrive most relevant first; `rank` keeps that
+    order through merging (a merged segment takes its best rank).
+    """
+    segs = []
+    for rank, h in enumerate(hits):
+        meta = h["metadata"]
+        segs.append({
+            "file_path": meta.get("file_path"),
+            "start_line": meta.get("start_line"),
+            "end_line": meta.get("end_line"),
+            "lines": h["text"].split("\n"),
+            "rank": rank,
+        })
+    return segs
+
+
+def _merge_overlapping(segs):
+    positioned, merged = [], []
+    for s in segs:
+        has_span = s["file_path"] and s["start_line"] and s["end_line"]
+        (positioned if has_span else merged).append(s)
+
+    positioned.sort(key=lambda s: (s["file_path"], s["start_line"]))
+    current = None
+    for seg in positioned:
+        if (current is not None and seg["file_path"] == current["file_path"]
+                and seg["start_line"] <= current["end_line"] + 1):
+            overlap = current["end_line"] - seg["start_line"] + 1
+            if seg["end_line"] > current["end_line"]:
+                current["lines"] = current["lines"] + seg["lines"][max(overlap, 0):]
+                current["end_line"] = seg["end_line"]
+            current["rank"] = min(current["rank"], seg["rank"])
+            continue
+        if current is not None:
+            merged.append(current)
+        current = dict(seg)
+    if current is not None:
+        merged.append(current)
+    return merged
+
+
+def _shingles(lines):
+    return {re.sub(r"\s+", " ", l).strip() for l in lines if l.strip()}
+
+
+def _drop_near_duplicates(segs):
+    kept, kept_shingles = [], []
+    for seg in sorted(segs, key=lambda s: s["rank"]):
+        sh = _shingles(seg["lines"])
+        duplicate = any(
+            sh and len(sh & other) / len(sh | other) >= NEAR_DUPLICATE_JACCARD
+            for other in kept_shingles
+        )
+        if not duplicate:
+            kept.append(seg)
+            kept_shingles.append(sh)
+    return kept
+
+
+def _render(seg) -> str:
+    if seg["start_line"]:
+        header = f"# {seg['file_path']} (lines {seg['start_line']}-{seg['end_line']})"
+    else:
+        header = f"# {seg['file_path'] or 'unknown'}"
+    return header + "\n" + "\n".join(seg["lines"])
+
+
+def _truncate(seg, budget: int):
+    lines = seg["lines"]
+    while lines and count_tokens(_render({**seg, "lines": lines})) > budget:
+        lines = lines[: len(lines) * 3 // 4]
+    if not lines:
+        return None
+    end_line = seg["start_line"] + len(lines) - 1 if seg["start_line"] else None
+    return {**seg, "lines": lines, "end_line": end_line}
+
+
+def assemble_context(hits, token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    segs = _drop_near_duplicates(_merge_overlapping(_segments(hits)))
+
+    packed, used = [], 0
+    for seg in segs:  # most relevant first
+        tokens = count_tokens(_render(seg))
+        if used + tokens > token_budget:
+            if packed:
+                continue
+            # always return something, even if the best hit alone is too big
+            seg = _truncate(seg, token_budget)
+            if seg is None:
+                continue
+            tokens = count_tokens(_render(seg))
+        packed.append(seg)
+        used += tokens
+
+    packed.sort(key=lambda s: (s["file_path"] or "", s["start_line"] or 0))
+    return "\n\n".join(_render(s) for s in packed)
@@ -1,19 +1,68 @@
-from ingestion.clone import clone_repo
-from .retriever import retrieve_chunks
-from .test_generator import generate_tests
-from .test_runner import save_tests, run_robot
+from ingestion.clone import clone_repo, repo_id_for
+from .retriever import retrieve_chunks, aretrieve_chunks, asearch_chunks
+from .test_generator import generate_tests, agenerate_tests, astream_tests
+from .test_runner import save_tests, run_robot, arun_robot, aiter_robot_shards, amerge_shards
+from .robot_results import parse_output_xml, summarize
+from .context_builder import assemble_context
 
+from config import ROBOT_RUNS_DIR, ROBOT_RUNS_KEEP
+
+import asyncio
+import shutil
+import uuid
 from pathlib import Path
 
-BASE_DIR = Path(__file__).resolve().parent.parent  # project root
-TESTS_DIR = BASE_DIR / "tests"
-TESTS_DIR.mkdir(exist_ok=True)
+# generated suites and robot output live outside the source tree
+RUNS_DIR = Path(ROBOT_RUNS_DIR)
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        # removed by a concurrent prune
+        return 0.0
+
+
+def _prune_runs(keep: int = ROBOT_RUNS_KEEP) -> None:
+    """
+    Removes all but the newest `keep` run directories (0 keeps them all).
+    """
+    if keep <= 0 or not RUNS_DIR.exists():
+        return
+    runs = sorted((p for p in RUNS_DIR.iterdir() if p.is_dir()), key=_mtime, reverse=True)
+    for old in runs[keep:]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def _request_dir() -> Path:
+    # each request runs only its own suites, in its own directory
+    _prune_runs()
+    run_dir = RUNS_DIR / uuid.uuid4().hex
+    run_dir.mkdir(parents=True)
+    return run_dir
+
 
-def generate_service(prompt: str, repo_url: str = None):
+def _response(saved_files, context: str, result: dict) -> dict:
+    # per-test records come from output.xml; stderr is only kept for the
+    # case where robot couldn't produce results at all
+    robot_results = parse_output_xml(result["output_xml"]) if result["output_xml"] else None
+    return {
+        "saved_files": saved_files,
+        "retrieved_context_preview": context[:1000],
+        "robot_results": robot_results,
+        "robot_errors": result["stderr"][:5000] if robot_results is None else "",
+        "timed_out_suites": result["timed_out"],
+        "exit_code": result["returncode"]
+    }
+
+
+def generate_service(prompt: str, repo_url: str = None, path_prefix: str = None):
     # repo_path = clone_repo(repo_url) if repo_url else tempfile.mkdtemp()
 
-    # STEP 1: retrieve relevant chunks
-    context = retrieve_chunks(prompt)
+    # STEP 1: retrieve relevant chunks (scoped to the repo when one is given)
+    repo_id = repo_id_for(repo_url) if repo_url else None
+    context = retrieve_chunks(prompt, repo_id=repo_id, path_prefix=path_prefix)
 
     # STEP 2: ask Groq
     tests = generate_tests(context, prompt)
@@ -22,14 +71,83 @@ def generate_service(prompt: str, repo_url: str = None):
     # tests_dir = Path("tests")
     # tests_dir.mkdir(exist_ok=True)
 
-    saved_files = save_tests(str(TESTS_DIR), tests)
+    run_dir = _request_dir()
+    saved_files = save_tests(str(run_dir), tests)
 
     # STEP 4: run tests
-    out, err, rc = run_robot(str(TESTS_DIR))
-    return {
-        "saved_files": saved_files,
-        "retrieved_context_preview": context[:1000],
-        "robot_output": out[:20000],
-        "robot_errors": err[:5000],
-        "exit_code": rc
+    result = run_robot(str(run_dir), suites=saved_files)
+    return _response(saved_files, context, result)
+
+
+async def agenerate_service(prompt: str, repo_url: str = None, path_prefix: str = None):
+    """
+    Same pipeline as generate_service without blocking the event loop:
+    async pgvector query, async LLM call and an async robot subprocess.
+    """
+    repo_id = repo_id_for(repo_url) if repo_url else None
+    context = await aretrieve_chunks(prompt, repo_id=repo_id, path_prefix=path_prefix)
+
+    tests = await agenerate_tests(context, prompt)
+
+    run_dir = await asyncio.to_thread(_request_dir)
+    saved_files = save_tests(str(run_dir), tests)
+
+    result = await arun_robot(str(run_dir), suites=saved_files)
+    # output.xml can be large; parse it off the event loop
+    return await asyncio.to_thread(_response, saved_files, context, result)
+
+
+async def agenerate_stream(prompt: str, repo_url: str = None, path_prefix: str = None):
+    """
+    Streaming variant of agenerate_service. Yields event dicts as each stage
+    produces them:
+      retrieval -> token* -> saved* -> test* -> done
+    An "error" event ends the stream early.
+    """
+    repo_id = repo_id_for(repo_url) if repo_url else None
+    hits = await asearch_chunks(prompt, repo_id=repo_id, path_prefix=path_prefix)
+    context = assemble_context(hits) if hits else ""
+    yield {
+        "event": "retrieval",
+        "chunks": [
+            {"node_id": h["node_id"], "file_path": h["metadata"].get("file_path"),
+             "distance": h["distance"]}
+            for h in hits
+        ],
+    }
+
+    tests = None
+    try:
+        async for kind, value in astream_tests(context, prompt):
+            if kind == "token":
+                yield {"event": "token", "delta": value}
+            else:
+                tests = value
+    except RuntimeError as e:
+        yield {"event": "error", "detail": str(e)}
+        return
+
+    run_dir = await asyncio.to_thread(_request_dir)
+    saved_files = save_tests(str(run_dir), tests)
+    for path in saved_files:
+        yield {"event": "saved", "file": path}
+
+    shards, results = [], []
+    async for shard in aiter_robot_shards(str(run_dir), suites=saved_files):
+        shards.append(shard)
+        # a timed-out shard's xml is partial at best; report it, don't parse it
+        if shard["returncode"] == -1 or not shard["output"].exists():
+            yield {"event": "suite_error", "suite": shard["suite"], "detail": shard["stderr"][:5000]}
+            continue
+        tests_done = await asyncio.to_thread(parse_output_xml, str(shard["output"]))
+        for record in tests_done["tests"]:
+            results.append(record)
+            yield {"event": "test", **record}
+
+    merged = await amerge_shards(str(run_dir), shards)
+    yield {
+        "event": "done",
+        "summary": summarize(results),
+        "timed_out_suites": merged["timed_out"],
+        "exit_code": merged["returncode"],
     }
@@ -1,13 +1,68 @@
 # generation/groq_client.py
 import os
 import requests
+from functools import lru_cache
 from llama_index.llms.groq import Groq
 from llama_index.core.llms import ChatMessage
-from config import GROQ_API_KEY, GROQ_MODEL
+from config import (
+    GROQ_API_KEY, GROQ_MODEL, GROQ_TEMPERATURE, LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES,
+)
+from .llm_cache import ResponseCache, SingleFlight, AsyncSingleFlight, response_key
 print("Using GROQ Model:", GROQ_MODEL)
 print()
 
-def call_groq(system_prompt: str, user_prompt: str) -> str:
+_single_flight = SingleFlight()
+_async_single_flight = AsyncSingleFlight()
+
+
+@lru_cache(maxsize=1)
+def get_llm():
+    return Groq(model=GROQ_MODEL, api_key=GROQ_API_KEY, temperature=GROQ_TEMPERATURE)
+
+
+@lru_cache(maxsize=1)
+def get_response_cache():
+    # only deterministic generations are worth replaying
+    if LLM_CACHE_MAX_ENTRIES <= 0 or GROQ_TEMPERATURE != 0:
+        return None
+    return ResponseCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES)
+
+
+def _cached(cache, key: str, validate):
+    """
+    Cached response for key, if it passes `validate`. Entries that don't
+    (cached before validation existed, or by a caller without one) are
+    dropped so the next call regenerates them.
+    """
+    if cache is None:
+        return None
+    cached = cache.get(key)
+    if cached is not None and validate is not None and not validate(cached):
+        cache.invalidate(key)
+        return None
+    return cached
+
+
+def _store(cache, key: str, response: str, validate) -> None:
+    # at temperature 0 a cached bad response would be replayed forever
+    if cache is not None and (validate is None or validate(response)):
+        cache.put(key, response)
+
+
+def _messages(system_prompt: str, user_prompt: str):
+    return [
+        ChatMessage(
+            role="system", content=system_prompt
+        ),
+        ChatMessage(role="user", content=user_prompt),
+    ]
+
+
+def call_groq(system_prompt: str, user_prompt: str, validate=None) -> str:
+    """
+    Chat completion, served from the response cache when possible. Only
+    responses for which `validate(text)` is true are cached.
+    """
     # headers = {
     #     "Authorization": f"Bearer {GROQ_API_KEY}",
     #     "Content-Type": "application/json"
@@ -34,13 +89,56 @@ def call_groq(system_prompt: str, user_prompt: str) -> str:
     # if "error" in data:
     #     raise Exception(f"Groq Error: {data['error']}")
     # return data["choices"][0]["message"]["content"]
-    llm = Groq(model=GROQ_MODEL, api_key=GROQ_API_KEY)
-    messages = [
-        ChatMessage(
-            role="system", content=system_prompt
-        ),
-        ChatMessage(role="user", content=user_prompt),
-    ]
-    resp = llm.chat(messages)
-    print(resp)
-    return resp.message.content
\ No newline at end of file
+    key = response_key(GROQ_MODEL, system_prompt, user_prompt, GROQ_TEMPERATURE)
+    cache = get_response_cache()
+    cached = _cached(cache, key, validate)
+    if cached is not None:
+        return cached
+
+    def _call():
+        llm = get_llm()
+        resp = llm.chat(_messages(system_prompt, user_prompt))
+        print(resp)
+        _store(cache, key, resp.message.content, validate)
+        return resp.message.content
+
+    return _single_flight.do(key, _call)
+
+
+async def acall_groq(system_prompt: str, user_prompt: str, validate=None) -> str:
+    key = response_key(GROQ_MODEL, system_prompt, user_prompt, GROQ_TEMPERATURE)
+    cache = get_response_cache()
+    cached = _cached(cache, key, validate)
+    if cached is not None:
+        return cached
+
+    async def _call():
+        llm = get_llm()
+        resp = await llm.achat(_messages(system_prompt, user_prompt))
+        print(resp)
+        _store(cache, key, resp.message.content, validate)
+        return resp.message.content
+
+    return await _async_single_flight.do(key, _call)
+
+
+async def astream_groq(system_prompt: str, user_prompt: str, validate=None):
+    """
+    Yields the completion as text deltas. A cached response is replayed as
+    a single delta; streamed calls are not coalesced.
+    """
+    key = response_key(GROQ_MODEL, system_prompt, user_prompt, GROQ_TEMPERATURE)
+    cache = get_response_cache()
+    cached = _cached(cache, key, validate)
+    if cached is not None:
+        yield cached
+        return
+
+    llm = get_llm()
+    parts = []
+    stream = await llm.astream_chat(_messages(system_prompt, user_prompt))
+    async for chunk in stream:
+        if chunk.delta:
+            parts.append(chunk.delta)
+            yield chunk.delta
+    _store(cache, key, "".join(parts), validate)
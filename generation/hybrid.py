@@ -0,0 +1,89 @@
+"""
+Pieces of hybrid retrieval that don't touch the database: turning a prompt
+into a full-text query, reciprocal-rank fusion, and optional cross-encoder
+reranking.
+"""
+import re
+from functools import lru_cache
+
+from config import RERANK_MODEL
+
+RRF_K = 60
+
+# `quoted`, dotted.names, path/like.py, snake_case and CamelCase tokens
+_IDENTIFIER = re.compile(
+    r"`([^`]+)`"
+    r"|([A-Za-z_][\w]*(?:[./][\w]+)+)"
+    r"|\b([A-Za-z]+_[\w]+|_[\w]+|[a-z]+[A-Z]\w*|[A-Z][a-z0-9]+[A-Z]\w*)\b"
+)
+
+
+def extract_identifiers(prompt: str) -> list:
+    seen, out = set(), []
+    for m in _IDENTIFIER.finditer(prompt):
+        ident = next(g for g in m.groups() if g).strip()
+        if ident and ident not in seen:
+            seen.add(ident)
+            out.append(ident)
+    return out
+
+
+def symbol_names(prompt: str) -> list:
+    """
+    Candidate names for the symbol table: each identifier, the last part of
+    dotted names, and module paths for things like http/utils.py.
+    """
+    names = []
+    for ident in extract_identifiers(prompt):
+        names.append(ident)
+        if ident.endswith(".py"):
+            names.append(ident[:-3].replace("/", "."))
+        elif "." in ident:
+            names.append(ident.rsplit(".", 1)[-1])
+    return list(dict.fromkeys(names))
+
+
+def lexical_query(prompt: str):
+    """
+    websearch_to_tsquery input that ORs the identifiers in the prompt, each
+    as a phrase. None when the prompt names nothing code-like, in which case
+    dense search alone is used.
+    """
+    idents = extract_identifiers(prompt)
+    if not idents:
+        return None
+    return " or ".join('"' + i.replace('"', " ") + '"' for i in idents)
+
+
+def rrf_fuse(rankings, limit: int, k: int = RRF_K) -> list:
+    """
+    Reciprocal-rank fusion of several ranked hit lists (dicts with
+    node_id). Returns up to `limit` hits, best first, with an "rrf" score.
+    """
+    scores, hits = {}, {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking):
+            node_id = hit["node_id"]
+            scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (k + rank + 1)
+            # keep the copy that has a vector distance, if any
+            if node_id not in hits or hits[node_id].get("distance") is None:
+                hits[node_id] = hit
+    ordered = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [{**hits[n], "rrf": scores[n]} for n in ordered]
+
+
+@lru_cache(maxsize=1)
+def get_reranker():
+    if not RERANK_MODEL:
+        return None
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(RERANK_MODEL)
+
+
+def rerank(query: str, hits: list, top_k: int) -> list:
+    reranker = get_reranker()
+    if reranker is None or not hits:
+        return hits[:top_k]
+    scores = reranker.predict([(query, h["text"]) for h in hits])
+    ranked = sorted(zip(hits, scores), key=lambda p: p[1], reverse=True)
+    return [{**h, "rerank_score": float(s)} for h, s in ranked[:top_k]]
@@ -0,0 +1,120 @@
+"""
+Response cache and single-flight coalescing for LLM calls.
+
+Responses are stored in SQLite keyed on (model, system prompt hash, user
+prompt hash, temperature) with LRU eviction. Concurrent identical calls share
+one in-flight request instead of each paying the round trip.
+"""
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+
+def response_key(model: str, system_prompt: str, user_prompt: str, temperature: float) -> str:
+    sys_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+    user_hash = hashlib.sha256(user_prompt.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{model}\0{sys_hash}\0{user_hash}\0{temperature}".encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path: str, max_entries: int):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, response TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+        return row[0]
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def put(self, key: str, response: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, last_used) VALUES (?, ?, ?)",
+                (key, response, time.time()),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+
+class SingleFlight:
+    """
+    Thread version: the first caller for a key runs fn, the rest wait on
+    its Future and get the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def do(self, key: str, fn):
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._inflight[key] = fut
+        if not leader:
+            return fut.result()
+
+        try:
+            result = fn()
+            fut.set_result(result)
+            return result
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+class AsyncSingleFlight:
+    """
+    Event-loop version of SingleFlight for coroutine functions.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+
+    async def do(self, key: str, coro_fn):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield so one cancelled waiter doesn't cancel the shared request
+        return await asyncio.shield(task)
@@ -0,0 +1,86 @@
+"""
+Two-level cache in front of retrieval:
+
+  query text -> query embedding                       (LRU)
+  (repo_id, path_prefix, embedding hash, top_k) -> hits (LRU + TTL)
+
+Result entries for a repo are dropped when that repo is re-ingested. The
+caches are per process; with several uvicorn workers each one keeps its own
+and relies on the TTL for changes ingested elsewhere.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from config import QUERY_EMBED_CACHE_SIZE, QUERY_RESULT_CACHE_SIZE, QUERY_RESULT_CACHE_TTL
+
+
+class LRUCache:
+    def __init__(self, maxsize: int, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, predicate) -> int:
+        with self._lock:
+            stale = [k for k in self._data if predicate(k)]
+            for k in stale:
+                del self._data[k]
+        return len(stale)
+
+
+_embeddings = LRUCache(QUERY_EMBED_CACHE_SIZE)
+_results = LRUCache(QUERY_RESULT_CACHE_SIZE, ttl=QUERY_RESULT_CACHE_TTL)
+
+
+def embedding_hash(embedding) -> str:
+    return hashlib.sha1(",".join(repr(float(x)) for x in embedding).encode()).hexdigest()
+
+
+def get_cached_embedding(query: str):
+    return _embeddings.get(query)
+
+
+def put_cached_embedding(query: str, embedding) -> None:
+    _embeddings.put(query, embedding)
+
+
+def _result_key(repo_id, path_prefix, embedding, top_k):
+    return (repo_id, path_prefix, embedding_hash(embedding), top_k)
+
+
+def get_cached_results(repo_id, path_prefix, embedding, top_k):
+    hits = _results.get(_result_key(repo_id, path_prefix, embedding, top_k))
+    return list(hits) if hits is not None else None
+
+
+def put_cached_results(repo_id, path_prefix, embedding, top_k, results) -> None:
+    _results.put(_result_key(repo_id, path_prefix, embedding, top_k), list(results))
+
+
+def invalidate_repo(repo_id: str) -> int:
+    # unscoped searches (repo_id None) span every repo, so they go too
+    return _results.invalidate(lambda key: key[0] in (repo_id, None))
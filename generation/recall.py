@@ -0,0 +1,85 @@
+"""
+Recall of the ANN search against exact search on our own data.
+
+    python -m generation.recall --samples 200 --k 10 [--repo-id ID]
+    python -m generation.recall --storage vector --storage halfvec --storage binary
+
+Query vectors are sampled from the stored embeddings themselves, so no
+model is needed; pass --query to measure real prompts instead. Each
+--storage mode is measured against its own index (build it first with
+VECTOR_STORAGE=<mode> python -m ingestion.ann_index create) and reported
+with that index's size. Use --repo-id to measure filtered searches, where
+ANN_ITERATIVE_SCAN matters (compare runs with it set to 'off').
+"""
+import argparse
+import time
+
+from sqlalchemy import text
+
+from config import VECTOR_STORAGE
+from ingestion.vector_store import DATA_TABLE, get_engine
+from ingestion.ann_index import index_size
+from ingestion.embedder import get_embedder
+from .retriever import search_by_embedding
+
+
+def _sample_embeddings(samples: int, repo_id: str = None):
+    where = "WHERE metadata_->>'repo_id' = :repo_id" if repo_id else ""
+    sql = text(
+        f"SELECT CAST(embedding AS text) AS embedding FROM {DATA_TABLE} {where} "
+        "ORDER BY random() LIMIT :samples"
+    )
+    with get_engine().connect() as conn:
+        rows = conn.execute(sql, {"repo_id": repo_id, "samples": samples}).scalars().all()
+    return [[float(x) for x in r.strip("[]").split(",")] for r in rows]
+
+
+def measure_recall(query_embeddings, k: int = 10, repo_id: str = None, storage: str = None) -> dict:
+    """
+    recall@k = |ANN top-k ∩ exact top-k| / |exact top-k|, averaged over queries.
+    The exact side always scans the full-precision vectors.
+    """
+    storage = storage or VECTOR_STORAGE
+    recalls, ann_secs, exact_secs = [], 0.0, 0.0
+    for emb in query_embeddings:
+        t0 = time.perf_counter()
+        ann = search_by_embedding(emb, repo_id=repo_id, top_k=k, storage=storage)
+        t1 = time.perf_counter()
+        exact = search_by_embedding(emb, repo_id=repo_id, top_k=k, exact=True)
+        t2 = time.perf_counter()
+        ann_secs += t1 - t0
+        exact_secs += t2 - t1
+
+        truth = {r["node_id"] for r in exact}
+        if truth:
+            recalls.append(len(truth & {r["node_id"] for r in ann}) / len(truth))
+
+    n = max(len(recalls), 1)
+    return {
+        "storage": storage,
+        "index_bytes": index_size(storage),
+        "queries": len(recalls),
+        "k": k,
+        "recall": sum(recalls) / n,
+        "ann_ms": 1000 * ann_secs / n,
+        "exact_ms": 1000 * exact_secs / n,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repo-id", default=None)
+    parser.add_argument("--query", action="append", default=[])
+    parser.add_argument("--storage", action="append", default=[],
+                        help="vector | halfvec | binary; repeat to compare (default: VECTOR_STORAGE)")
+    args = parser.parse_args()
+
+    if args.query:
+        embedder = get_embedder()
+        embeddings = [embedder.get_query_embedding(q) for q in args.query]
+    else:
+        embeddings = _sample_embeddings(args.samples, args.repo_id)
+    for storage in args.storage or [VECTOR_STORAGE]:
+        print(measure_recall(embeddings, k=args.k, repo_id=args.repo_id, storage=storage))
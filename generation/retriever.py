@@ -1,21 +1,279 @@
-from llama_index.core import VectorStoreIndex
-from ingestion.vector_store import get_pg_store
-from ingestion.embedder import get_embedder
+import asyncio
+import json
 
+from sqlalchemy import text
 
-def retrieve_chunks( query: str):
-    pg_store = get_pg_store()
+from ingestion.vector_store import DATA_TABLE, get_engine, get_async_engine
+from ingestion.ann_index import search_settings_sql, distance_expression, rescore_candidates
+from ingestion.embedder import get_embedder, get_embed_executor
+from ingestion.symbols import lookup_symbols, alookup_symbols
+from config import (
+    CONTEXT_CANDIDATES, HYBRID_SEARCH, HYBRID_CANDIDATES, RERANK_MODEL, SYMBOL_LOOKUP_LIMIT,
+    VECTOR_STORAGE,
+)
+from .context_builder import assemble_context
+from .hybrid import lexical_query, rrf_fuse, rerank, symbol_names
+from .query_cache import (
+    get_cached_embedding, put_cached_embedding, get_cached_results, put_cached_results,
+)
 
-    # use the SAME embedder you used during ingestion
-    embedder = get_embedder()
+TOP_K = CONTEXT_CANDIDATES
 
-    index = VectorStoreIndex.from_vector_store(
-        vector_store=pg_store,
-        embed_model=embedder
+
+def _vector_literal(embedding) -> str:
+    return "[" + ",".join(repr(float(x)) for x in embedding) + "]"
+
+
+def _filter_clause(repo_id: str = None, path_prefix: str = None):
+    clauses, params = [], {}
+    if repo_id:
+        clauses.append("metadata_->>'repo_id' = :repo_id")
+        params["repo_id"] = repo_id
+    if path_prefix:
+        escaped = path_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        clauses.append("metadata_->>'file_path' LIKE :path_prefix ESCAPE '\\'")
+        params["path_prefix"] = escaped + "%"
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    return where, params
+
+
+_QVEC = "CAST(CAST(:qvec AS text) AS vector)"
+
+
+def _search_sql(query_embedding, repo_id, path_prefix, top_k, storage=VECTOR_STORAGE):
+    """
+    Full-precision cosine search. With a quantized index (storage 'halfvec'
+    or 'binary') the inner query walks that index for a wider candidate set
+    and the outer one re-scores it against the stored float32 vectors.
+    """
+    where, params = _filter_clause(repo_id, path_prefix)
+    params.update(qvec=_vector_literal(query_embedding), top_k=top_k)
+    if storage == "vector":
+        sql = (
+            f"SELECT node_id, text, metadata_, embedding <=> {_QVEC} AS distance "
+            f"FROM {DATA_TABLE} {where} ORDER BY distance LIMIT :top_k"
+        )
+        if where:
+            # a filtered query may run as a relaxed-order iterative scan, so
+            # the index's rows get re-sorted
+            sql = f"SELECT * FROM ({sql}) AS hits ORDER BY distance"
+        return text(sql), params
+
+    sql = text(
+        f"SELECT node_id, text, metadata_, embedding <=> {_QVEC} AS distance FROM ("
+        f"SELECT node_id, text, metadata_, embedding FROM {DATA_TABLE} {where} "
+        f"ORDER BY {distance_expression(_QVEC, storage)} LIMIT :candidates"
+        ") AS candidates ORDER BY distance LIMIT :top_k"
+    )
+    params["candidates"] = rescore_candidates(top_k, storage)
+    return sql, params
+
+
+def _to_result(row) -> dict:
+    metadata = row["metadata_"] or {}
+    if isinstance(metadata, str):
+        # asyncpg hands json columns back undecoded
+        metadata = json.loads(metadata)
+    return {
+        "node_id": row["node_id"],
+        "text": row["text"],
+        "metadata": metadata,
+        "distance": row["distance"],
+    }
+
+
+def _lexical_sql(tsquery, repo_id, path_prefix, limit):
+    # the expression must match the GIN index: to_tsvector('simple', text)
+    where, params = _filter_clause(repo_id, path_prefix)
+    match = "to_tsvector('simple', text) @@ q"
+    where = f"{where} AND {match}" if where else f"WHERE {match}"
+    sql = text(
+        "SELECT node_id, text, metadata_, CAST(NULL AS float8) AS distance "
+        f"FROM {DATA_TABLE}, websearch_to_tsquery('simple', :tsquery) AS q {where} "
+        "ORDER BY ts_rank_cd(to_tsvector('simple', text), q) DESC LIMIT :limit"
     )
+    params.update(tsquery=tsquery, limit=limit)
+    return sql, params
+
+
+def lexical_search(tsquery: str, repo_id: str = None, path_prefix: str = None, limit: int = TOP_K):
+    sql, params = _lexical_sql(tsquery, repo_id, path_prefix, limit)
+    with get_engine().connect() as conn:
+        rows = conn.execute(sql, params).mappings().all()
+    return [_to_result(r) for r in rows]
+
+
+async def alexical_search(tsquery: str, repo_id: str = None, path_prefix: str = None, limit: int = TOP_K):
+    sql, params = _lexical_sql(tsquery, repo_id, path_prefix, limit)
+    async with get_async_engine().connect() as conn:
+        rows = (await conn.execute(sql, params)).mappings().all()
+    return [_to_result(r) for r in rows]
+
+
+def _chunks_sql(node_ids):
+    sql = text(
+        "SELECT node_id, text, metadata_, CAST(NULL AS float8) AS distance "
+        f"FROM {DATA_TABLE} WHERE node_id = ANY(:node_ids)"
+    )
+    return sql, {"node_ids": list(node_ids)}
+
+
+def _defining_ids(symbols, path_prefix):
+    ids = []
+    for sym in symbols:
+        if path_prefix and not sym["file_path"].startswith(path_prefix):
+            continue
+        if sym["chunk_ids"]:
+            ids.append(sym["chunk_ids"][0])
+    return list(dict.fromkeys(ids))
+
+
+def _order_by_ids(rows, ids):
+    by_id = {r["node_id"]: _to_result(r) for r in rows}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def symbol_search(query: str, repo_id: str = None, path_prefix: str = None):
+    """
+    Defining chunks of the symbols named in the query, via the symbol table.
+    """
+    names = symbol_names(query)
+    if not names:
+        return []
+    ids = _defining_ids(lookup_symbols(names, repo_id, SYMBOL_LOOKUP_LIMIT), path_prefix)
+    if not ids:
+        return []
+    sql, params = _chunks_sql(ids)
+    with get_engine().connect() as conn:
+        rows = conn.execute(sql, params).mappings().all()
+    return _order_by_ids(rows, ids)
+
+
+async def asymbol_search(query: str, repo_id: str = None, path_prefix: str = None):
+    names = symbol_names(query)
+    if not names:
+        return []
+    symbols = await alookup_symbols(names, repo_id, SYMBOL_LOOKUP_LIMIT)
+    ids = _defining_ids(symbols, path_prefix)
+    if not ids:
+        return []
+    sql, params = _chunks_sql(ids)
+    async with get_async_engine().connect() as conn:
+        rows = (await conn.execute(sql, params)).mappings().all()
+    return _order_by_ids(rows, ids)
+
+
+def _with_symbols(symbol_hits, results):
+    # exact symbol matches lead; search hits fill in behind them
+    seen = {h["node_id"] for h in symbol_hits}
+    return symbol_hits + [r for r in results if r["node_id"] not in seen]
+
+
+def _candidate_k(top_k: int) -> int:
+    # fusion and reranking need a wider pool than what ends up in the prompt
+    if HYBRID_SEARCH or RERANK_MODEL:
+        return max(top_k, HYBRID_CANDIDATES)
+    return top_k
+
+
+def search_by_embedding(query_embedding, repo_id: str = None, path_prefix: str = None,
+                        top_k: int = TOP_K, exact: bool = False, storage: str = None):
+    """
+    Cosine search over the pgvector table with the repo / path filters pushed
+    into SQL. Uses the ANN index unless `exact` is set, which always scans
+    the full-precision vectors. `storage` overrides VECTOR_STORAGE.
+    Returns dicts with node_id, text, metadata and distance.
+    """
+    storage = "vector" if exact else (storage or VECTOR_STORAGE)
+    sql, params = _search_sql(query_embedding, repo_id, path_prefix, top_k, storage)
+    with get_engine().begin() as conn:
+        for stmt in search_settings_sql(exact, params.get("candidates", top_k), bool(repo_id or path_prefix)):
+            conn.execute(text(stmt))
+        rows = conn.execute(sql, params).mappings().all()
+    return [_to_result(r) for r in rows]
+
+
+async def asearch_by_embedding(query_embedding, repo_id: str = None, path_prefix: str = None,
+                               top_k: int = TOP_K, exact: bool = False, storage: str = None):
+    storage = "vector" if exact else (storage or VECTOR_STORAGE)
+    sql, params = _search_sql(query_embedding, repo_id, path_prefix, top_k, storage)
+    async with get_async_engine().begin() as conn:
+        for stmt in search_settings_sql(exact, params.get("candidates", top_k), bool(repo_id or path_prefix)):
+            await conn.execute(text(stmt))
+        rows = (await conn.execute(sql, params)).mappings().all()
+    return [_to_result(r) for r in rows]
+
+
+def search_chunks(query: str, repo_id: str = None, path_prefix: str = None, top_k: int = TOP_K):
+    """
+    Dense search, fused with Postgres full-text search over the identifiers
+    in the query (RRF) and optionally reranked by a cross-encoder. Chunks
+    defining symbols named in the query are put first.
+    """
+    query_embedding = get_cached_embedding(query)
+    if query_embedding is None:
+        # use the SAME embedder you used during ingestion
+        query_embedding = get_embedder().get_query_embedding(query)
+        put_cached_embedding(query, query_embedding)
+
+    results = get_cached_results(repo_id, path_prefix, query_embedding, top_k)
+    if results is not None:
+        return results
+
+    k = _candidate_k(top_k)
+    hits = search_by_embedding(query_embedding, repo_id, path_prefix, k)
+    tsquery = lexical_query(query) if HYBRID_SEARCH else None
+    if tsquery:
+        lexical_hits = lexical_search(tsquery, repo_id, path_prefix, k)
+        hits = rrf_fuse([hits, lexical_hits], limit=k)
+    results = _with_symbols(symbol_search(query, repo_id, path_prefix), rerank(query, hits, top_k))
+
+    put_cached_results(repo_id, path_prefix, query_embedding, top_k, results)
+    return results
+
+
+async def asearch_chunks(query: str, repo_id: str = None, path_prefix: str = None, top_k: int = TOP_K):
+    loop = asyncio.get_running_loop()
+    query_embedding = get_cached_embedding(query)
+    if query_embedding is None:
+        # embedding is CPU-bound; keep it off the event loop on a bounded pool
+        # the model is resolved on the pool too: a first-call load must not
+        # block the event loop either
+        query_embedding = await loop.run_in_executor(
+            get_embed_executor(), lambda: get_embedder().get_query_embedding(query)
+        )
+        put_cached_embedding(query, query_embedding)
+
+    results = get_cached_results(repo_id, path_prefix, query_embedding, top_k)
+    if results is not None:
+        return results
+
+    k = _candidate_k(top_k)
+    tsquery = lexical_query(query) if HYBRID_SEARCH else None
+    if tsquery:
+        hits, lexical_hits = await asyncio.gather(
+            asearch_by_embedding(query_embedding, repo_id, path_prefix, k),
+            alexical_search(tsquery, repo_id, path_prefix, k),
+        )
+        hits = rrf_fuse([hits, lexical_hits], limit=k)
+    else:
+        hits = await asearch_by_embedding(query_embedding, repo_id, path_prefix, k)
+    results = await loop.run_in_executor(get_embed_executor(), rerank, query, hits, top_k)
+    results = _with_symbols(await asymbol_search(query, repo_id, path_prefix), results)
+
+    put_cached_results(repo_id, path_prefix, query_embedding, top_k, results)
+    return results
+
+
+def retrieve_chunks(query: str, repo_id: str = None, path_prefix: str = None):
+    results = search_chunks(query, repo_id=repo_id, path_prefix=path_prefix)
+    if not results:
+        return ""
+    return assemble_context(results)
+
 
-    retriever = index.as_retriever(similarity_top_k=6)
-    results = retriever.retrieve(query)
+async def aretrieve_chunks(query: str, repo_id: str = None, path_prefix: str = None):
+    results = await asearch_chunks(query, repo_id=repo_id, path_prefix=path_prefix)
     if not results:
         return ""
-    return "\n\n".join([r.get_text() for r in results])
+    return assemble_context(results)
@@ -0,0 +1,103 @@
+"""
+Streams a Robot Framework output.xml into compact per-test records.
+
+Finished test, keyword and suite elements are cleared and detached from
+their parent as soon as they've been read, so memory stays bounded by
+nesting depth rather than by the size of the file. Handles both the RF 7
+(start/elapsed) and RF 6 (starttime/endtime) status formats.
+"""
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import Optional
+
+
+def _duration(status) -> Optional[float]:
+    if status is None:
+        return None
+    if status.get("elapsed") is not None:
+        return float(status.get("elapsed"))
+    start, end = status.get("starttime"), status.get("endtime")
+    if not start or not end or "N/A" in (start, end):
+        return None
+    fmt = "%Y%m%d %H:%M:%S.%f"
+    return (datetime.strptime(end, fmt) - datetime.strptime(start, fmt)).total_seconds()
+
+
+def iter_test_results(output_xml: str):
+    """
+    Yields one dict per test:
+      name, suite, status, duration (seconds), failing_keyword, message
+    """
+    suites = []
+    keywords = []
+    current = None
+    # open elements; the parent of a closing element is the one before it
+    stack = []
+
+    def release(elem):
+        # clear() alone leaves the emptied element attached to its parent
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+    for event, elem in ET.iterparse(output_xml, events=("start", "end")):
+        tag = elem.tag
+
+        if event == "start":
+            stack.append(elem)
+            if tag == "suite":
+                suites.append(elem.get("name"))
+            elif tag == "test":
+                current = {
+                    "name": elem.get("name"),
+                    "suite": ".".join(suites),
+                    "status": None,
+                    "duration": None,
+                    "failing_keyword": None,
+                    "message": "",
+                }
+                keywords = []
+            elif tag == "kw" and current is not None:
+                keywords.append(elem.get("name"))
+            continue
+
+        stack.pop()
+        if tag == "kw" and current is not None:
+            status = elem.find("status")
+            # the innermost failing keyword closes first
+            if (status is not None and status.get("status") == "FAIL"
+                    and current["failing_keyword"] is None):
+                current["failing_keyword"] = " > ".join(keywords)
+            keywords.pop()
+            release(elem)
+        elif tag == "test" and current is not None:
+            status = elem.find("status")
+            if status is not None:
+                current["status"] = status.get("status")
+                current["message"] = (status.text or "").strip()
+            current["duration"] = _duration(status)
+            yield current
+            current = None
+            release(elem)
+        elif tag == "suite":
+            suites.pop()
+            release(elem)
+        elif tag == "errors":
+            release(elem)
+
+
+def summarize(tests) -> dict:
+    summary = {"total": len(tests), "passed": 0, "failed": 0, "skipped": 0}
+    for t in tests:
+        if t["status"] == "PASS":
+            summary["passed"] += 1
+        elif t["status"] == "FAIL":
+            summary["failed"] += 1
+        elif t["status"] == "SKIP":
+            summary["skipped"] += 1
+    return summary
+
+
+def parse_output_xml(output_xml: str) -> dict:
+    tests = list(iter_test_results(output_xml))
+    return {"summary": summarize(tests), "tests": tests}
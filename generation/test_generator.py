@@ -1,20 +1,20 @@
 import json
-from .groq_client import call_groq
+from .groq_client import call_groq, acall_groq, astream_groq
 from config import prompt_rules as system_prompt
 
-def generate_tests(context: str, user_prompt: str) -> dict:
-    full_prompt = (
+
+def _full_prompt(context: str, user_prompt: str) -> str:
+    return (
         f"Context:\n{context}\n\n"
         f"User Request:\n{user_prompt}\n\n"
         f"Return ONLY valid JSON. No text outside JSON. "
     )
 
-    try:
-        raw = call_groq(system_prompt, full_prompt)
 
+def _parse(raw: str) -> dict:
+    try:
         # Try parsing JSON directly
         return json.loads(raw)
-
     except json.JSONDecodeError:
         # LLM returned garbage → wrap it so at least pipeline doesn't explode
         return {
@@ -22,6 +22,41 @@ def generate_tests(context: str, user_prompt: str) -> dict:
             "raw_output": raw
         }
 
+
+def _is_json(raw: str) -> bool:
+    # only parseable generations go into the response cache
+    try:
+        json.loads(raw)
+    except json.JSONDecodeError:
+        return False
+    return True
+
+
+def generate_tests(context: str, user_prompt: str) -> dict:
+    try:
+        raw = call_groq(system_prompt, _full_prompt(context, user_prompt), validate=_is_json)
+    except Exception as e:
+        raise RuntimeError(f"generate_tests failed: {e}")
+    return _parse(raw)
+
+
+async def agenerate_tests(context: str, user_prompt: str) -> dict:
+    try:
+        raw = await acall_groq(system_prompt, _full_prompt(context, user_prompt), validate=_is_json)
     except Exception as e:
         raise RuntimeError(f"generate_tests failed: {e}")
+    return _parse(raw)
+
 
+async def astream_tests(context: str, user_prompt: str):
+    """
+    Yields ("token", delta) while the model writes, then ("tests", dict).
+    """
+    parts = []
+    try:
+        async for delta in astream_groq(system_prompt, _full_prompt(context, user_prompt), validate=_is_json):
+            parts.append(delta)
+            yield "token", delta
+    except Exception as e:
+        raise RuntimeError(f"generate_tests failed: {e}")
+    yield "tests", _parse("".join(parts))
@@ -1,6 +1,23 @@
+import asyncio
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from config import ROBOT_WORKERS, ROBOT_SHARD_TIMEOUT
+
+# ROBOT_WORKERS caps robot processes across all concurrent requests, not
+# per request; the async slots are created on first use, inside the loop
+_shard_slots = threading.BoundedSemaphore(max(ROBOT_WORKERS, 1))
+_async_shard_slots = None
+
+
+def _ashard_slots() -> asyncio.Semaphore:
+    global _async_shard_slots
+    if _async_shard_slots is None:
+        _async_shard_slots = asyncio.Semaphore(max(ROBOT_WORKERS, 1))
+    return _async_shard_slots
+
 
 def save_tests(tests_dir: str, tests: dict):
     """
@@ -26,21 +43,173 @@ def save_tests(tests_dir: str, tests: dict):
     return saved
 
 
-def run_robot(tests_dir: str):
+def _find_suites(tests_dir: str):
+    return sorted(str(p) for p in Path(tests_dir).rglob("*.robot"))
+
+
+def _shard_cmd(suite: str, output: Path):
+    # one suite per robot process; logs are produced once, by rebot, at merge time
+    return ["robot", "--output", str(output), "--log", "NONE", "--report", "NONE", suite]
+
+
+def _merge_cmd(shard_outputs):
+    return [
+        "rebot", "--name", "Tests",
+        "--output", "output.xml", "--log", "log.html", "--report", "report.html",
+        *[str(p) for p in shard_outputs],
+    ]
+
+
+def _run_shard(tests_dir: str, index: int, suite: str, timeout: float):
+    output = Path(tests_dir) / f"shard_{index}.xml"
+    try:
+        with _shard_slots:
+            proc = subprocess.run(
+                _shard_cmd(suite, output),
+                cwd=tests_dir,
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+            )
+        return {"index": index, "suite": suite, "output": output, "stdout": proc.stdout,
+                "stderr": proc.stderr, "returncode": proc.returncode}
+    except subprocess.TimeoutExpired as e:
+        return {"index": index, "suite": suite, "output": output, "stdout": _partial(e.stdout),
+                "stderr": _partial(e.stderr) + f"Timed out after {timeout}s", "returncode": -1}
+
+
+def _partial(output) -> str:
+    # TimeoutExpired carries raw bytes on POSIX even with text=True
+    if isinstance(output, bytes):
+        return output.decode(errors="replace")
+    return output or ""
+
+
+def _finished(shard) -> bool:
+    # a killed shard leaves an empty or truncated xml that rebot can't read
+    return shard["returncode"] != -1 and shard["output"].exists()
+
+
+def _merge_inputs(shards: list):
+    return [s["output"] for s in shards if _finished(s)]
+
+
+def _combine(tests_dir: str, shards: list, merge_proc):
     """
-    Run Robot Framework *inside* the /tests directory.
-    Example:
-        robot .
+    Folds shard results and the rebot merge into run_robot's return value.
+    `merge_proc` is (stdout, stderr, returncode) or None if nothing to merge.
     """
-    proc = subprocess.run(
-        ["robot", "."],
-        cwd=tests_dir,
-        capture_output=True,
-        text=True
-    )
+    stdout = "".join(s["stdout"] for s in shards)
+    stderr = "".join(s["stderr"] for s in shards)
+    timed_out = [s["suite"] for s in shards if s["returncode"] == -1]
+    returncode = max([s["returncode"] for s in shards], default=0)
+    output_xml = None
+
+    if merge_proc is not None:
+        m_out, m_err, m_rc = merge_proc
+        stdout += m_out
+        stderr += m_err
+        merged = Path(tests_dir) / "output.xml"
+        # rebot exits with the failed-test count (capped at 250); anything
+        # above that means it failed and wrote no usable output.xml
+        if 0 <= m_rc <= 250 and merged.exists():
+            output_xml = str(merged)
+        # rebot's rc is the failed-test count of the merged run; keep -1
+        # visible when a shard never finished
+        returncode = -1 if timed_out else m_rc
 
     return {
-        "stdout": proc.stdout,
-        "stderr": proc.stderr,
-        "returncode": proc.returncode
+        "stdout": stdout,
+        "stderr": stderr,
+        "returncode": returncode,
+        "output_xml": output_xml,
+        "timed_out": timed_out,
     }
+
+
+def run_robot(tests_dir: str, suites=None, workers: int = ROBOT_WORKERS,
+              timeout: float = ROBOT_SHARD_TIMEOUT):
+    """
+    Run Robot Framework *inside* tests_dir, one robot process per suite
+    file (pabot-style), at most `workers` at a time for this run and
+    ROBOT_WORKERS across the process, then merge the shard
+    outputs into a single output.xml / log.html / report.html with rebot.
+    `suites` defaults to every .robot file under tests_dir.
+    """
+    suites = list(suites) if suites is not None else _find_suites(tests_dir)
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        shards = list(pool.map(
+            lambda item: _run_shard(tests_dir, item[0], item[1], timeout),
+            enumerate(suites),
+        ))
+
+    outputs = _merge_inputs(shards)
+    merge_proc = None
+    if outputs:
+        proc = subprocess.run(_merge_cmd(outputs), cwd=tests_dir, capture_output=True, text=True)
+        merge_proc = (proc.stdout, proc.stderr, proc.returncode)
+
+    return _combine(tests_dir, shards, merge_proc)
+
+
+async def _arun(cmd, cwd: str, timeout: float = None):
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return "", f"Timed out after {timeout}s", -1
+    except asyncio.CancelledError:
+        # e.g. a streaming client went away; don't leave robot running
+        proc.kill()
+        raise
+    return stdout.decode(errors="replace"), stderr.decode(errors="replace"), proc.returncode
+
+
+async def _arun_shard(tests_dir: str, index: int, suite: str, timeout: float):
+    output = Path(tests_dir) / f"shard_{index}.xml"
+    async with _ashard_slots():
+        out, err, rc = await _arun(_shard_cmd(suite, output), tests_dir, timeout)
+    return {"index": index, "suite": suite, "output": output,
+            "stdout": out, "stderr": err, "returncode": rc}
+
+
+async def aiter_robot_shards(tests_dir: str, suites=None, timeout: float = ROBOT_SHARD_TIMEOUT):
+    """
+    Runs the shards like arun_robot but yields each one as soon as it
+    finishes, so callers can report results before the whole run is done.
+    Shards of every request share the ROBOT_WORKERS slots.
+    """
+    suites = list(suites) if suites is not None else _find_suites(tests_dir)
+    tasks = [
+        asyncio.ensure_future(_arun_shard(tests_dir, i, suite, timeout))
+        for i, suite in enumerate(suites)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def amerge_shards(tests_dir: str, shards: list) -> dict:
+    shards = sorted(shards, key=lambda s: s["index"])
+    outputs = _merge_inputs(shards)
+    merge_proc = await _arun(_merge_cmd(outputs), tests_dir) if outputs else None
+    return _combine(tests_dir, shards, merge_proc)
+
+
+async def arun_robot(tests_dir: str, suites=None, timeout: float = ROBOT_SHARD_TIMEOUT):
+    """
+    Async variant of run_robot; the event loop stays free while robot runs.
+    """
+    shards = [s async for s in aiter_robot_shards(tests_dir, suites, timeout)]
+    return await amerge_shards(tests_dir, shards)
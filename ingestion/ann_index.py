@@ -0,0 +1,210 @@
+"""
+Approximate nearest-neighbour index on the pgvector embedding column.
+
+    python -m ingestion.ann_index create    # create if missing
+    python -m ingestion.ann_index rebuild   # drop + create, e.g. after a bulk ingest
+    python -m ingestion.ann_index drop halfvec   # drop another storage mode's index
+
+VECTOR_STORAGE picks what the index holds. The table always keeps the full
+float32 vectors; with 'halfvec' (float16, half the size) or 'binary' (one bit
+per dimension, 1/32) the index is built over a quantized expression of the
+column, and searches re-score the index's candidates at full precision.
+Each mode has its own index, so several can exist side by side (e.g. to
+compare them with generation.recall); create/rebuild only touch the current
+one. Drop the index of a mode you no longer use, as it costs memory.
+"""
+import logging
+import math
+import sys
+import time
+
+from sqlalchemy import text
+
+from config import (
+    ANN_INDEX_TYPE, HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH,
+    IVFFLAT_LISTS, IVFFLAT_PROBES, VECTOR_STORAGE, RESCORE_FACTOR, ANN_ITERATIVE_SCAN,
+)
+from .vector_store import DATA_TABLE, SCHEMA_NAME, TABLE_NAME, EMBED_DIM, get_engine, get_pg_store
+
+ANN_INDEX_NAME = f"data_{TABLE_NAME}_embedding_ann_idx"
+STORAGE_TYPES = ("vector", "halfvec", "binary")
+# pgvector rejects hnsw.ef_search above this
+HNSW_MAX_EF_SEARCH = 1000
+
+logger = logging.getLogger(__name__)
+_warned_ef_clamp = False
+
+
+def ann_index_name(storage: str = VECTOR_STORAGE) -> str:
+    # full precision keeps the original name so existing indexes still match
+    if storage == "vector":
+        return ANN_INDEX_NAME
+    return f"data_{TABLE_NAME}_embedding_{storage}_ann_idx"
+
+
+def _check_storage(storage: str) -> None:
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"Unknown VECTOR_STORAGE: {storage}")
+
+
+def index_expression(storage: str = VECTOR_STORAGE) -> str:
+    """
+    The indexed expression and operator class. Queries must order by the
+    same expression (see distance_expression) for the planner to use it.
+    """
+    _check_storage(storage)
+    if storage == "halfvec":
+        return f"(CAST(embedding AS halfvec({EMBED_DIM}))) halfvec_cosine_ops"
+    if storage == "binary":
+        return f"(CAST(binary_quantize(embedding) AS bit({EMBED_DIM}))) bit_hamming_ops"
+    return "embedding vector_cosine_ops"
+
+
+def distance_expression(query_vector: str, storage: str = VECTOR_STORAGE) -> str:
+    """
+    Distance between the indexed column and `query_vector` (a SQL expression
+    of type vector) in the index's own representation.
+    """
+    _check_storage(storage)
+    if storage == "halfvec":
+        return f"CAST(embedding AS halfvec({EMBED_DIM})) <=> CAST({query_vector} AS halfvec({EMBED_DIM}))"
+    if storage == "binary":
+        return (f"CAST(binary_quantize(embedding) AS bit({EMBED_DIM})) "
+                f"<~> CAST(binary_quantize({query_vector}) AS bit({EMBED_DIM}))")
+    return f"embedding <=> {query_vector}"
+
+
+def rescore_candidates(top_k: int, storage: str = VECTOR_STORAGE) -> int:
+    """
+    Rows taken from a quantized index before full-precision re-scoring;
+    just top_k when the index is already full precision.
+    """
+    if storage == "vector":
+        return top_k
+    return top_k * max(RESCORE_FACTOR, 1)
+
+
+def _ivfflat_lists(conn) -> int:
+    if IVFFLAT_LISTS > 0:
+        return IVFFLAT_LISTS
+    # pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond
+    rows = conn.execute(text(f"SELECT COUNT(*) FROM {DATA_TABLE}")).scalar() or 0
+    if rows <= 1_000_000:
+        return max(rows // 1000, 10)
+    return int(math.sqrt(rows))
+
+
+def _create_sql(conn) -> str:
+    name, expr = ann_index_name(), index_expression()
+    if ANN_INDEX_TYPE == "hnsw":
+        return (
+            f"CREATE INDEX IF NOT EXISTS {name} ON {DATA_TABLE} "
+            f"USING hnsw ({expr}) "
+            f"WITH (m = {int(HNSW_M)}, ef_construction = {int(HNSW_EF_CONSTRUCTION)})"
+        )
+    if ANN_INDEX_TYPE == "ivfflat":
+        return (
+            f"CREATE INDEX IF NOT EXISTS {name} ON {DATA_TABLE} "
+            f"USING ivfflat ({expr}) "
+            f"WITH (lists = {_ivfflat_lists(conn)})"
+        )
+    raise ValueError(f"Unknown ANN_INDEX_TYPE: {ANN_INDEX_TYPE}")
+
+
+def ensure_ann_index() -> None:
+    if ANN_INDEX_TYPE == "none":
+        return
+    get_pg_store()._initialize()
+    with get_engine().begin() as conn:
+        conn.execute(text(_create_sql(conn)))
+
+
+def rebuild_ann_index() -> float:
+    """
+    Drops and recreates the index for the current VECTOR_STORAGE. IVFFlat
+    lists are computed from the data, so rebuild after large ingests.
+    Indexes of other storage modes are left alone (see drop_ann_index).
+    Returns the build time in seconds.
+    """
+    get_pg_store()._initialize()
+    start = time.perf_counter()
+    with get_engine().begin() as conn:
+        conn.execute(text(f'DROP INDEX IF EXISTS "{SCHEMA_NAME}".{ann_index_name()}'))
+        if ANN_INDEX_TYPE != "none":
+            conn.execute(text(_create_sql(conn)))
+    return time.perf_counter() - start
+
+
+def drop_ann_index(storage: str) -> None:
+    _check_storage(storage)
+    with get_engine().begin() as conn:
+        conn.execute(text(f'DROP INDEX IF EXISTS "{SCHEMA_NAME}".{ann_index_name(storage)}'))
+
+
+def index_size(storage: str = VECTOR_STORAGE):
+    """
+    On-disk size in bytes of the ANN index for `storage`, or None if it
+    hasn't been built.
+    """
+    with get_engine().connect() as conn:
+        return conn.execute(
+            text("SELECT pg_relation_size(to_regclass(:name))"),
+            {"name": f'"{SCHEMA_NAME}".{ann_index_name(storage)}'},
+        ).scalar()
+
+
+def search_settings_sql(exact: bool = False, limit: int = 0, filtered: bool = False) -> list:
+    """
+    Per-query search knobs as SET LOCAL statements; run them inside the
+    query's transaction. `exact=True` disables index scans for ground truth.
+    `limit` is the number of rows the index scan must return; HNSW never
+    returns more than ef_search, so it is raised to match (up to pgvector's
+    limit of HNSW_MAX_EF_SEARCH).
+    `filtered` marks a WHERE clause (repo / path) applied after the index
+    scan: without an iterative scan most of the ef_search / probes
+    candidates can belong to other repos and the query comes back short.
+    ANN_ITERATIVE_SCAN lets the scan keep going until enough rows pass the
+    filter; set it to 'off' on pgvector < 0.8, which doesn't have it.
+    """
+    global _warned_ef_clamp
+    if exact:
+        return ["SET LOCAL enable_indexscan = off"]
+    iterative = filtered and ANN_ITERATIVE_SCAN != "off"
+    if ANN_INDEX_TYPE == "hnsw":
+        ef_search = max(int(HNSW_EF_SEARCH), int(limit))
+        if ef_search > HNSW_MAX_EF_SEARCH:
+            if not _warned_ef_clamp:
+                _warned_ef_clamp = True
+                logger.warning(
+                    "hnsw.ef_search %d exceeds pgvector's maximum; clamped to %d, so the "
+                    "index returns at most that many candidates and recall is capped "
+                    "(lower RESCORE_FACTOR or the candidate count)",
+                    ef_search, HNSW_MAX_EF_SEARCH,
+                )
+            ef_search = HNSW_MAX_EF_SEARCH
+        settings = [f"SET LOCAL hnsw.ef_search = {ef_search}"]
+        if iterative:
+            settings.append(f"SET LOCAL hnsw.iterative_scan = {ANN_ITERATIVE_SCAN}")
+        return settings
+    if ANN_INDEX_TYPE == "ivfflat":
+        settings = [f"SET LOCAL ivfflat.probes = {int(IVFFLAT_PROBES)}"]
+        if iterative:
+            # ivfflat only has the relaxed mode
+            settings.append("SET LOCAL ivfflat.iterative_scan = relaxed_order")
+        return settings
+    return []
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "create"
+    if cmd == "create":
+        ensure_ann_index()
+        print(f"{ANN_INDEX_TYPE} index ready: {ann_index_name()}")
+    elif cmd == "rebuild":
+        elapsed = rebuild_ann_index()
+        print(f"Rebuilt {ANN_INDEX_TYPE} index {ann_index_name()} ({VECTOR_STORAGE}) in {elapsed:.1f}s")
+    elif cmd == "drop" and len(sys.argv) > 2:
+        drop_ann_index(sys.argv[2])
+        print(f"Dropped {ann_index_name(sys.argv[2])}")
+    else:
+        raise SystemExit("usage: python -m ingestion.ann_index [create|rebuild|drop <storage>]")
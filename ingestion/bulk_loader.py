@@ -0,0 +1,143 @@
+import io
+import json
+import queue
+import threading
+import time
+
+import psycopg2
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+from config import PG_COPY_BATCH_SIZE, PG_COPY_MAX_PENDING
+from .vector_store import PG_PARAMS, DATA_TABLE, get_pg_store
+
+_DONE = object()
+
+
+def _copy_escape(value: str) -> str:
+    # COPY text format: backslash, tab, newline and CR must be escaped;
+    # Postgres text cannot hold NUL at all
+    return (
+        value.replace("\x00", "")
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_row(node) -> str:
+    metadata = node_to_metadata_dict(node, remove_text=True, flat_metadata=False)
+    vector = "[" + ",".join(repr(float(x)) for x in node.embedding) + "]"
+    return "\t".join([
+        _copy_escape(node.get_content()),
+        _copy_escape(json.dumps(metadata)),
+        _copy_escape(node.node_id),
+        vector,
+    ]) + "\n"
+
+
+class PGBulkLoader:
+    """
+    Writes embedded nodes into the PGVectorStore table with COPY, one
+    transaction per batch, on a background thread.
+
+    add() blocks once `max_pending` batches are queued, so a writer that falls
+    behind slows the embedding stage down instead of buffering without bound.
+    """
+
+    def __init__(self, batch_size: int = PG_COPY_BATCH_SIZE, max_pending: int = PG_COPY_MAX_PENDING):
+        self.batch_size = batch_size
+        self.rows = 0
+        self.seconds = 0.0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._aborted = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        # let PGVectorStore create the extension/table the first time
+        get_pg_store()._initialize()
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            # don't COPY the backlog for a run that's failing anyway, and
+            # don't let a writer error replace the original exception
+            self.abort()
+            return
+        self.close()
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def add(self, nodes) -> None:
+        for i in range(0, len(nodes), self.batch_size):
+            batch = nodes[i:i + self.batch_size]
+            while True:
+                self._raise_if_failed()
+                try:
+                    self._queue.put(batch, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(_DONE)
+            self._thread.join()
+        self._raise_if_failed()
+
+    def abort(self) -> None:
+        """
+        Stops the writer without committing queued batches; a batch already
+        being copied is rolled back. Never raises.
+        """
+        self._aborted.set()
+        if self._thread.is_alive():
+            self._drain()
+            self._queue.put(_DONE)
+            self._thread.join()
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise RuntimeError(f"pgvector bulk load failed: {self._error}") from self._error
+
+    def _run(self):
+        conn = None
+        try:
+            conn = psycopg2.connect(**PG_PARAMS)
+            while True:
+                batch = self._queue.get()
+                if batch is _DONE or self._aborted.is_set():
+                    return
+                start = time.perf_counter()
+                buf = io.StringIO("".join(_copy_row(n) for n in batch))
+                with conn.cursor() as cur:
+                    cur.copy_expert(
+                        f"COPY {DATA_TABLE} (text, metadata_, node_id, embedding) FROM STDIN",
+                        buf,
+                    )
+                if self._aborted.is_set():
+                    conn.rollback()
+                    return
+                conn.commit()
+                self.seconds += time.perf_counter() - start
+                self.rows += len(batch)
+        except Exception as e:
+            if conn is not None:
+                conn.rollback()
+            self._error = e
+            # drain so a blocked producer can observe the error
+            self._drain()
+        finally:
+            if conn is not None:
+                conn.close()
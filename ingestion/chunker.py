@@ -31,45 +31,145 @@
 
 #     return docs
 
-import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 from llama_index.core import Document
 from llama_index.core.node_parser import CodeSplitter, SimpleNodeParser
+from config import CHUNK_WORKERS
+from .symbols import extract_symbols, attach_chunk_ids
+from .extractor import walk_relevant_files, read_text_file
 
-def chunk_repo_files(workspace: str):
-    nodes = []
+# tree-sitter-language-pack is the declared dependency; tree_sitter_languages
+# is its older, unmaintained predecessor and still works if that's installed
+try:
+    from tree_sitter_language_pack import get_parser
+except ImportError:
+    from tree_sitter_languages import get_parser
 
-    for root, dirs, files in os.walk(workspace):
-        for f in files:
-            file_path = Path(root, f)
-            if not file_path.is_file():
+# One parser/splitter per worker process, built once in _init_worker and
+# reused for every file that worker handles.
+_py_parser = None
+_code_splitter = None
+_text_parser = None
+
+
+def _init_worker():
+    global _py_parser, _code_splitter, _text_parser
+    # the CodeSplitter and the symbol extraction share one tree-sitter parser
+    _py_parser = get_parser("python")
+    # Use built-in CodeSplitter for Python code
+    _code_splitter = CodeSplitter(
+        language="python",
+        chunk_lines=80,
+        chunk_lines_overlap=20,
+        max_chars=3000,
+        parser=_py_parser
+    )
+    # Use simple text splitter for docs
+    _text_parser = SimpleNodeParser.from_defaults(
+        chunk_size=1024,
+        chunk_overlap=100
+    )
+
+
+# bookkeeping used for filtering and context assembly only; it shouldn't
+# change the embedding text (and so the embedding cache key) or show up in
+# the LLM context
+_FILTER_ONLY_KEYS = ["source", "repo_id", "commit", "start_line", "end_line"]
+# the path stays visible to the LLM but is left out of the embedding text,
+# so a file that is moved or copied unchanged hits the embedding cache
+_EMBED_EXCLUDED_KEYS = _FILTER_ONLY_KEYS + ["file_path"]
+
+
+def _line_span(text: str, node, search_from: int):
+    """
+    1-based inclusive line range of a node inside its file. The splitters
+    record char offsets when they can; otherwise fall back to a search.
+    """
+    start = node.start_char_idx
+    if start is None:
+        start = text.find(node.text, search_from)
+        if start < 0:
+            return None, None
+    end = start + len(node.text)
+    return text.count("\n", 0, start) + 1, text.count("\n", 0, end) + 1
+
+
+def _chunk_file(root: str, rel_path: str, extra_metadata: dict):
+    """
+    Returns (nodes, symbols) for one file, read straight from `root`;
+    symbols only for Python. Binary files yield nothing.
+    """
+    file_path = Path(root, rel_path)
+    text = read_text_file(file_path)
+    if text is None:
+        return [], []
+    is_python = rel_path.endswith(".py")
+
+    splitter = _code_splitter if is_python else _text_parser
+    new_nodes = splitter.get_nodes_from_documents([Document(text=text)])
+
+    # Add metadata
+    search_from = 0
+    for n in new_nodes:
+        start_line, end_line = _line_span(text, n, search_from)
+        n.metadata = {**extra_metadata, "source": str(file_path), "file_path": rel_path,
+                      "start_line": start_line, "end_line": end_line}
+        if n.start_char_idx is not None:
+            search_from = n.start_char_idx
+        n.excluded_embed_metadata_keys = list(_EMBED_EXCLUDED_KEYS)
+        n.excluded_llm_metadata_keys = list(_FILTER_ONLY_KEYS)
+
+    symbols = []
+    if is_python:
+        source = text.encode("utf-8")
+        symbols = extract_symbols(_py_parser.parse(source), source, rel_path)
+        attach_chunk_ids(symbols, new_nodes)
+    return new_nodes, symbols
+
+
+def iter_chunks(root: str, paths=None, workers: int = CHUNK_WORKERS, extra_metadata=None,
+                symbol_sink=None):
+    """
+    Yields nodes file by file while files are still being parsed across a
+    process pool. At most `workers * 4` files are in flight, so memory stays
+    bounded by the consumer rather than by the size of the repo.
+    `extra_metadata` (e.g. repo_id, commit) is attached to every node;
+    `symbol_sink`, if given, receives each file's symbol list.
+    """
+    paths = iter(paths if paths is not None else walk_relevant_files(root))
+    extra_metadata = extra_metadata or {}
+
+    def emit(result):
+        nodes, symbols = result
+        if symbol_sink is not None and symbols:
+            symbol_sink(symbols)
+        return nodes
+
+    if workers <= 1:
+        _init_worker()
+        for rel in paths:
+            yield from emit(_chunk_file(root, rel, extra_metadata))
+        return
+
+    # ingest runs on threads of a process that has torch and a DB pool
+    # loaded; forking that can deadlock workers on locks held by other
+    # threads, so they start from a clean forkserver instead
+    mp_context = multiprocessing.get_context("forkserver")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             mp_context=mp_context) as pool:
+        pending = set()
+        for rel in paths:
+            pending.add(pool.submit(_chunk_file, root, rel, extra_metadata))
+            if len(pending) < workers * 4:
                 continue
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                yield from emit(fut.result())
+        for fut in pending:
+            yield from emit(fut.result())
+
 
-            text = file_path.read_text(errors="ignore")
-
-            # Use built-in CodeSplitter for Python code
-            if f.endswith(".py"):
-                splitter = CodeSplitter(
-                    language="python",
-                    chunk_lines=80,
-                    chunk_lines_overlap=20, 
-                    max_chars=3000
-                )
-                doc = Document(text=text)
-                new_nodes = splitter.get_nodes_from_documents([doc])
-
-            # Use simple text splitter for docs
-            else:
-                parser = SimpleNodeParser.from_defaults(
-                    chunk_size=1024,
-                    chunk_overlap=100
-                )
-                doc = Document(text=text)
-                new_nodes = parser.get_nodes_from_documents([doc])
-
-            # Add metadata
-            for n in new_nodes:
-                n.metadata = {"source": str(file_path)}
-
-            nodes.extend(new_nodes)
-    return nodes
+def chunk_repo_files(root: str):
+    return list(iter_chunks(root))
@@ -1,21 +1,134 @@
+import fcntl
 import hashlib
+import logging
+from contextlib import contextmanager
 from pathlib import Path
 import shutil
-from git import Repo
-from config import CLONE_BASE
+from git import Repo, Git, GitCommandError, InvalidGitRepositoryError, NoSuchPathError
+from config import CLONE_BASE, CLONE_DEPTH, CLONE_FILTER, CLONE_SPARSE, CLONE_CACHE
+from .extractor import ALLOWED_EXT
 
+CACHE_PATH = Path(CLONE_BASE) / "_cache.git"
 
-def clone_repo(url: str) -> str:
-    repo_id = hashlib.sha1(url.encode()).hexdigest()[:10]
+logger = logging.getLogger(__name__)
+
+
+def repo_id_for(url: str) -> str:
+    return hashlib.sha1(url.encode()).hexdigest()[:10]
+
+
+@contextmanager
+def repo_lock(repo_id: str):
+    """
+    Exclusive lock on one repo's clone and manifest, across threads and
+    processes (flock on a per-repo lock file). Not re-entrant.
+    """
+    lock_path = Path(CLONE_BASE) / f"{repo_id}.lock"
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "w") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _fetch_opts(filter_blobs: bool) -> dict:
+    opts = {}
+    if CLONE_DEPTH > 0:
+        opts["depth"] = CLONE_DEPTH
+    if filter_blobs and CLONE_FILTER:
+        opts["filter"] = CLONE_FILTER
+    return opts
+
+
+def _sparse_checkout(repo: Repo) -> None:
+    if CLONE_SPARSE:
+        # only the file types we ingest end up in the working tree
+        repo.git.sparse_checkout("set", "--no-cone", *[f"*{ext}" for ext in sorted(ALLOWED_EXT)])
+
+
+def _cache_fetch(url: str, repo_id: str, commit: str = None) -> str:
+    """
+    Fetches url's HEAD (or `commit`) into the bare object cache shared by
+    every URL, so forks and re-clones reuse objects already on disk.
+    Returns the fetched commit sha.
+    """
+    ref = f"refs/repos/{repo_id}"
+    # a shallow fetch rewrites the cache's single `shallow` file and a
+    # concurrent one fails on shallow.lock, so those queue cache-wide. Full
+    # fetches write disjoint refs and objects atomically; only same-URL ones
+    # need to queue.
+    lock_id = "_cache" if CLONE_DEPTH > 0 else f"_cache/{repo_id}"
+    with repo_lock(lock_id):
+        if not CACHE_PATH.exists():
+            Repo.init(str(CACHE_PATH), bare=True)
+        cache = Git(str(CACHE_PATH))
+        # working copies borrow blobs from the cache, so it can't be blobless
+        cache.fetch(url, f"+{commit or 'HEAD'}:{ref}", **_fetch_opts(filter_blobs=False))
+        return cache.rev_parse(ref)
+
+
+def _link_to_cache(path: Path) -> None:
+    """
+    Points a working copy's object store at the cache (git alternates) and
+    mirrors the cache's shallow boundary, so nothing is copied.
+    """
+    git_dir = path / ".git"
+    (git_dir / "objects" / "info").mkdir(parents=True, exist_ok=True)
+    (git_dir / "objects" / "info" / "alternates").write_text(
+        str((CACHE_PATH / "objects").resolve()) + "\n"
+    )
+    shallow = CACHE_PATH / "shallow"
+    if shallow.exists():
+        shutil.copyfile(shallow, git_dir / "shallow")
+
+
+def _update(url: str, repo_id: str, path: Path, commit: str = None) -> None:
+    repo = Repo(str(path))
+    if CLONE_CACHE:
+        sha = _cache_fetch(url, repo_id, commit)
+        _link_to_cache(path)
+        repo.git.checkout("--force", "--detach", sha)
+        return
+    repo.git.fetch("origin", commit or "HEAD", **_fetch_opts(filter_blobs=True))
+    repo.git.checkout("--force", "--detach", "FETCH_HEAD")
+
+
+def _clone(url: str, repo_id: str, path: Path, commit: str = None) -> None:
+    if CLONE_CACHE:
+        sha = _cache_fetch(url, repo_id, commit)
+        repo = Repo.init(str(path))
+        repo.git.remote("add", "origin", url)
+        _link_to_cache(path)
+    else:
+        repo = Repo.clone_from(url, str(path), no_checkout=True, **_fetch_opts(filter_blobs=True))
+        sha = "HEAD"
+        if commit:
+            repo.git.fetch("origin", commit, **_fetch_opts(filter_blobs=True))
+            sha = "FETCH_HEAD"
+    _sparse_checkout(repo)
+    repo.git.checkout("--force", "--detach", sha)
+
+
+def clone_repo(url: str, commit: str = None) -> str:
+    """
+    Clones or updates url at CLONE_BASE/<repo_id> and checks out its HEAD,
+    or `commit` if given. Shallow, blobless and sparse according to config;
+    through the shared object cache when CLONE_CACHE is on.
+    Callers should hold repo_lock(repo_id_for(url)).
+    """
+    repo_id = repo_id_for(url)
     path = Path(CLONE_BASE) / repo_id
 
     if path.exists():
         try:
-            repo = Repo(str(path))
-            repo.remotes.origin.pull()
+            _update(url, repo_id, path, commit)
             return str(path)
-        except:
+        except (GitCommandError, InvalidGitRepositoryError, NoSuchPathError) as e:
+            # includes half-written or corrupted checkouts
+            logger.warning("Update of %s failed, re-cloning: %s", path, e)
             shutil.rmtree(path)
 
-    Repo.clone_from(url, str(path))
+    _clone(url, repo_id, path, commit)
     return str(path)
@@ -1,9 +1,141 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from config import HF_EMBED_MODEL
+from llama_index.core.schema import MetadataMode
+from config import (
+    HF_EMBED_MODEL, EMBED_CACHE_PATH, EMBED_CACHE_MAX_ENTRIES, EMBED_EXECUTOR_WORKERS,
+    EMBED_BATCH_TOKENS, EMBED_MAX_BATCH_SIZE, EMBED_TORCH_THREADS,
+)
+import torch
 from transformers import AutoTokenizer
+from .embed_cache import EmbeddingCache
 
+
+def _load_once(fn):
+    """
+    lru_cache(maxsize=1) for a no-argument loader. lru_cache alone lets
+    threads that miss at the same time (executor workers on the first
+    requests) each load their own copy; the lock makes them wait for one.
+    """
+    cached = lru_cache(maxsize=1)(fn)
+    lock = threading.Lock()
+
+    @wraps(fn)
+    def wrapper():
+        with lock:
+            return cached()
+
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
+
+# Model weights are loaded once per process and shared by every request.
+@_load_once
 def get_embedder():
-    return HuggingFaceEmbedding(model_name=HF_EMBED_MODEL)
+    if EMBED_TORCH_THREADS > 0:
+        # torch otherwise takes every core, fighting the chunk workers and
+        # the COPY writer for CPU during ingest
+        torch.set_num_threads(EMBED_TORCH_THREADS)
+    # embed_nodes already hands over token-budgeted batches; this only keeps
+    # get_text_embedding_batch from splitting them again
+    return HuggingFaceEmbedding(model_name=HF_EMBED_MODEL, embed_batch_size=EMBED_MAX_BATCH_SIZE)
+
+
+@_load_once
+def get_tokenizer():
+    return AutoTokenizer.from_pretrained(HF_EMBED_MODEL)
+
+
+@_load_once
+def get_embed_executor():
+    # bounded pool for embedding from async code, so concurrent requests
+    # queue here instead of oversubscribing the CPU
+    return ThreadPoolExecutor(max_workers=EMBED_EXECUTOR_WORKERS, thread_name_prefix="embed")
+
+
+@_load_once
+def get_embed_cache():
+    if EMBED_CACHE_MAX_ENTRIES <= 0:
+        return None
+    return EmbeddingCache(EMBED_CACHE_PATH, HF_EMBED_MODEL, EMBED_CACHE_MAX_ENTRIES)
+
+
+def _token_lengths(texts, tokenizer):
+    # one batched call to the fast tokenizer; includes special tokens since
+    # that is what the model pads to
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=True)["input_ids"]]
+
+
+def _token_batches(lengths, max_tokens: int, max_size: int):
+    """
+    Groups indices into batches of similar token length, shortest first.
+    A batch costs roughly (longest member) * (batch size) once padded, so
+    batches are closed when that would exceed `max_tokens`.
+    """
+    batch = []
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        # sorted ascending, so lengths[i] is the padded width of the batch
+        if batch and (lengths[i] * (len(batch) + 1) > max_tokens or len(batch) >= max_size):
+            yield batch
+            batch = []
+        batch.append(i)
+    if batch:
+        yield batch
+
+
+def _embed_texts(texts, lengths, embedder):
+    max_length = getattr(embedder, "max_length", None)
+    if max_length:
+        # the model truncates, so longer texts pad no wider than this
+        lengths = [min(n, max_length) for n in lengths]
+    out = [None] * len(texts)
+    for idx in _token_batches(lengths, EMBED_BATCH_TOKENS, EMBED_MAX_BATCH_SIZE):
+        for i, emb in zip(idx, embedder.get_text_embedding_batch([texts[i] for i in idx])):
+            out[i] = emb
+    return out
+
+
+def embed_nodes(nodes, embedder, tokenizer=None):
+    """
+    Sets node.embedding for every node, serving repeated chunk texts from the
+    on-disk cache and only sending misses to the model, in batches bucketed
+    by token length (see _token_batches).
+    Returns (cache hits, total embedding tokens); texts are tokenized once
+    and the counts are reused for both.
+    """
+    cache = get_embed_cache()
+    texts = [n.get_content(metadata_mode=MetadataMode.EMBED) for n in nodes]
+    lengths = _token_lengths(texts, tokenizer or get_tokenizer())
+    total_tokens = sum(lengths)
+
+    if cache is None:
+        for n, emb in zip(nodes, _embed_texts(texts, lengths, embedder)):
+            n.embedding = emb
+        return 0, total_tokens
+
+    keys = [cache.key(t) for t in texts]
+    cached = cache.get_many(keys)
+
+    misses = {}
+    for i, k in enumerate(keys):
+        if k not in cached:
+            misses.setdefault(k, i)
+
+    if misses:
+        miss_keys = list(misses)
+        fresh = _embed_texts(
+            [texts[misses[k]] for k in miss_keys],
+            [lengths[misses[k]] for k in miss_keys],
+            embedder,
+        )
+        new_items = dict(zip(miss_keys, fresh))
+        cache.put_many(new_items)
+        cached.update(new_items)
+
+    for n, k in zip(nodes, keys):
+        n.embedding = cached[k]
+    return len(nodes) - len(misses), total_tokens
 
 
 def get_embedding_dimension():
@@ -26,15 +158,3 @@ def get_embedding_dimension():
 #     return len(tokens)
 
 # print(count_tokens("public class Example {}"))
-
-def count_embedding_tokens(nodes, tokenizer):
-    total = 0
-    per_node = []
-
-    for node in nodes:
-        text = node.text
-        token_count = len(tokenizer.encode(text, add_special_tokens=False))
-        per_node.append((node.node_id, token_count))
-        total += token_count
-
-    return total, per_node
@@ -1,24 +1,61 @@
 import os
-import shutil
 from pathlib import Path
 
-def extract_relevant_files(repo_path: str, workspace: str) -> None:
+from git import Repo
+
+from config import MAX_FILE_BYTES, INGEST_EXCLUDE_DIRS
+
+# ALLOWED_EXT = {".py", ".md", ".txt", ".rst"}
+ALLOWED_EXT = {'.py'}
+
+
+def _excluded_dir(name: str) -> bool:
+    return name == ".git" or name in INGEST_EXCLUDE_DIRS
+
+
+def list_relevant_files(repo_path: str) -> tuple[str, dict]:
     """
-    We keep only:
-      - *.py
-      - *.md / *.txt / *.rst (docs)
+    Files to ingest, enumerated in place from the clone's HEAD tree:
+    (HEAD commit sha, {rel path: git blob sha}).
+
+    Only tracked files are listed, so anything .gitignore'd never shows up.
+    Excluded (vendored) directories are pruned during the traversal, and
+    oversized files are skipped using the blob size from the tree, without
+    reading them. Binary files are rejected later, when a worker reads them.
     """
-    # allowed_ext = {".py", ".md", ".txt", ".rst"}
-    allowed_ext = {'.py'}
+    repo = Repo(repo_path)
+    commit = repo.head.commit
+
+    def prune(item, depth):
+        return item.type == "tree" and _excluded_dir(item.name)
 
-    for root, dirs, files in os.walk(repo_path):
-        if ".git" in root:
+    files = {}
+    for item in commit.tree.traverse(prune=prune):
+        if item.type != "blob":
             continue
-        rel = os.path.relpath(root, repo_path)
-        target_dir = Path(workspace) / rel
-        target_dir.mkdir(parents=True, exist_ok=True)
+        if Path(item.path).suffix in ALLOWED_EXT and item.size <= MAX_FILE_BYTES:
+            files[item.path] = item.hexsha
+    return commit.hexsha, files
 
+
+def walk_relevant_files(root: str):
+    """
+    Same filter for a plain directory: yields rel paths, pruning excluded
+    directories before os.walk descends into them.
+    """
+    for dirpath, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if not _excluded_dir(d)]
         for f in files:
-            ext = Path(f).suffix
-            if ext in allowed_ext:
-                shutil.copy2(Path(root) / f, target_dir / f)
+            path = Path(dirpath, f)
+            if path.suffix in ALLOWED_EXT and path.is_file() and path.stat().st_size <= MAX_FILE_BYTES:
+                yield path.relative_to(root).as_posix()
+
+
+def read_text_file(path: Path):
+    """
+    File contents as text, or None for binary files (NUL in the first 8 KiB).
+    """
+    data = path.read_bytes()
+    if b"\x00" in data[:8192]:
+        return None
+    return data.decode("utf-8", errors="ignore")
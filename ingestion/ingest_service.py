@@ -1,54 +1,165 @@
-import tempfile
+from collections import defaultdict
 from pathlib import Path
-from llama_index.core import VectorStoreIndex, StorageContext, Settings
 
-from .clone import clone_repo
-from .extractor import extract_relevant_files
-from .chunker import chunk_repo_files
-from .embedder import get_embedder, count_embedding_tokens
-from .vector_store import get_pg_store
-from transformers import AutoTokenizer
-from config import HF_EMBED_MODEL
+from .clone import clone_repo, repo_id_for, repo_lock
+from .extractor import list_relevant_files
+from .chunker import iter_chunks
+from .embedder import get_embedder, get_tokenizer, embed_nodes
+from .manifest import load_manifest, save_manifest, diff_manifest
+from .vector_store import get_pg_store, ensure_metadata_index, ensure_text_search_index, delete_repo_rows
+from .bulk_loader import PGBulkLoader
+from .ann_index import ensure_ann_index
+from .symbols import ensure_symbol_table, replace_symbols
+from config import INGEST_BATCH_SIZE
+from generation.query_cache import invalidate_repo
 
 
-def ingest_repo_service(repo_url: str):
-    repo_path = clone_repo(repo_url)
+def _batched(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-    workspace = tempfile.mkdtemp()
-    extract_relevant_files(repo_path, workspace)
 
-    # chunking
-    nodes = chunk_repo_files(workspace)
+def _no_progress(stage: str, **counters):
+    pass
 
-    # embedding
-    embedder = get_embedder()
-    Settings.embed_model = embedder
 
-    # ----- TOKEN COUNTING -----
-    tokenizer = AutoTokenizer.from_pretrained(HF_EMBED_MODEL)
-    # Count tokens
-    total_tokens = 0
-    tokens_per_node = []
+def ingest_repo_service(repo_url: str, incremental: bool = True, progress=None, revision: str = None):
+    """
+    Ingests repo_url at its HEAD, or at commit `revision` if given.
+    `progress(stage, **counters)` is called between stages and batches; it
+    may raise to abort the ingest (used for job cancellation).
+    Concurrent ingests of the same URL run one after the other.
+    """
+    progress = progress or _no_progress
+    repo_id = repo_id_for(repo_url)
+
+    progress("waiting")
+    with repo_lock(repo_id):
+        return _ingest(repo_url, repo_id, incremental, progress, revision)
+
+
+def _ingest(repo_url: str, repo_id: str, incremental: bool, progress, revision: str):
+    progress("cloning")
+    repo_path = clone_repo(repo_url, revision)
 
-    for node in nodes:
-        tc = len(tokenizer.encode(node.text, add_special_tokens=False))
-        tokens_per_node.append((node.node_id, tc))
-        total_tokens += tc
-    print("Total Tokens Used: ",total_tokens)
-    print("Tokens Per Node: ",len(tokens_per_node))
+    # ----- DIFF AGAINST MANIFEST -----
+    progress("diffing")
+    manifest = load_manifest(repo_id)
+    commit, blobs = list_relevant_files(repo_path)
+
+    if incremental:
+        added, modified, removed = diff_manifest(manifest, blobs)
+    else:
+        # full re-ingest: every file is new and the repo's rows are dropped below
+        added, modified, removed = list(blobs), [], list(manifest["files"])
+
+    changed = added + modified
+    stale_ids = [
+        node_id
+        for path in modified + removed
+        for node_id in manifest["files"].get(path, {}).get("nodes", [])
+    ]
+    print(f"Ingest {repo_id}@{commit[:8]}: {len(added)} added, "
+          f"{len(modified)} modified, {len(removed)} removed")
 
     # vector store (pgvector)
     pg_store = get_pg_store()
+    ensure_metadata_index()
+    if not incremental:
+        # everything stored for the repo goes, including rows a lost or
+        # stale manifest doesn't know about
+        progress("deleting", rows_deleted=delete_repo_rows(repo_id))
+    elif stale_ids:
+        progress("deleting", rows_deleted=len(stale_ids))
+        pg_store.delete_nodes(node_ids=stale_ids)
+
+    # chunking -> embedding -> indexing, streamed in batches so the chunk
+    # workers keep parsing while the main thread embeds
+    nodes_by_path = defaultdict(list)
+    symbols = []
+    chunks = 0
+    total_tokens = 0
+    try:
+        if changed:
+            progress("chunking", files_total=len(changed))
+
+            embedder = get_embedder()
+            tokenizer = get_tokenizer()
+
+            # COPY into pgvector on a writer thread while the next batch embeds
+            with PGBulkLoader() as loader:
+                # workers read straight from the clone; nothing is copied
+                chunk_stream = iter_chunks(
+                    repo_path,
+                    paths=changed,
+                    extra_metadata={"repo_id": repo_id, "commit": commit},
+                    symbol_sink=symbols.extend,
+                )
+                for batch in _batched(chunk_stream, INGEST_BATCH_SIZE):
+                    # token counts come from the same tokenization that sizes
+                    # the embedding batches
+                    hits, batch_tokens = embed_nodes(batch, embedder, tokenizer)
+                    total_tokens += batch_tokens
+
+                    # nodes are written as-is so the manifest node IDs match pgvector
+                    loader.add(batch)
+
+                    for n in batch:
+                        nodes_by_path[n.metadata["file_path"]].append(n.node_id)
+                    chunks += len(batch)
+                    print(f"Embedded {chunks} chunks (batch cache hits: {hits}/{len(batch)})")
+                    progress(
+                        "embedding",
+                        files_chunked=len(nodes_by_path),
+                        nodes_embedded=chunks,
+                        rows_written=loader.rows,
+                    )
+
+            print("Total Tokens Used: ",total_tokens)
+            print("Tokens Per Node: ",chunks)
+            print(f"Inserted {loader.rows} rows at {loader.rows_per_sec:.0f} rows/sec")
+            progress("embedding", rows_written=loader.rows)
+
+        # created after the first load; later COPYs update it incrementally
+        progress("indexing")
+        ensure_ann_index()
+        ensure_text_search_index()
+
+        # symbol table rows for every file we re-chunked or dropped
+        ensure_symbol_table()
+        replace_symbols(repo_id, changed + removed, symbols)
 
-    # build index INSIDE the vector store
-    storage_context = StorageContext.from_defaults(vector_store=pg_store)
+        # ----- UPDATE MANIFEST -----
+        files = {p: e for p, e in manifest["files"].items() if p in blobs}
+        for path in changed:
+            files[path] = {"sha": blobs[path], "nodes": nodes_by_path.get(path, [])}
+        save_manifest(repo_id, {"commit": commit, "files": files})
+    except BaseException:
+        # the manifest isn't updated for an aborted run (cancelled, or failed
+        # anywhere up to save_manifest), so drop the rows it already wrote;
+        # otherwise the retry would insert duplicates
+        written = [i for ids in nodes_by_path.values() for i in ids]
+        if written:
+            pg_store.delete_nodes(node_ids=written)
+        raise
 
-    index = VectorStoreIndex.from_documents(
-        nodes,
-        storage_context=storage_context
-    )
+    # cached search results for this repo are stale now
+    invalidate_repo(repo_id)
 
     return {
         "status": "success",
-        "chunks": len(nodes)
+        "commit": commit,
+        "files_added": len(added),
+        "files_modified": len(modified),
+        "files_removed": len(removed),
+        "chunks": chunks,
+        "symbols": len(symbols),
+        "tokens": total_tokens,
+        "rows_per_sec": round(loader.rows_per_sec, 1) if changed else None
     }
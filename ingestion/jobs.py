@@ -0,0 +1,152 @@
+"""
+In-process ingestion job queue.
+
+Jobs are recorded in SQLite so their status survives the request that
+submitted them, and run on a thread pool limited to INGEST_CONCURRENCY.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+from config import INGEST_CONCURRENCY, JOBS_DB_PATH
+from .ingest_service import ingest_repo_service
+
+
+class IngestCancelled(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(self, db_path: str = JOBS_DB_PATH, concurrency: int = INGEST_CONCURRENCY):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, repo_url TEXT NOT NULL, incremental INTEGER NOT NULL,"
+            " status TEXT NOT NULL, stage TEXT, progress TEXT NOT NULL DEFAULT '{}',"
+            " result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "revision" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN revision TEXT")
+        self._conn.commit()
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ingest")
+        self._futures = {}
+        self._cancel_events = {}
+        self._resume()
+
+    def _update(self, job_id: str, **fields) -> None:
+        fields["updated_at"] = time.time()
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {cols} WHERE id = ?", [*fields.values(), job_id])
+            self._conn.commit()
+
+    def _resume(self) -> None:
+        # a job that was running when the process died can't be trusted halfway
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'interrupted by restart' "
+                "WHERE status = 'running'"
+            )
+            queued = self._conn.execute(
+                "SELECT id, repo_url, incremental, revision FROM jobs WHERE status = 'queued' "
+                "ORDER BY created_at"
+            ).fetchall()
+            self._conn.commit()
+        for job_id, repo_url, incremental, revision in queued:
+            self._schedule(job_id, repo_url, bool(incremental), revision)
+
+    def submit(self, repo_url: str, incremental: bool = True, revision: str = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, repo_url, incremental, revision, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, repo_url, int(incremental), revision, now, now),
+            )
+            self._conn.commit()
+        self._schedule(job_id, repo_url, incremental, revision)
+        return job_id
+
+    def _schedule(self, job_id: str, repo_url: str, incremental: bool, revision: str = None) -> None:
+        self._cancel_events[job_id] = threading.Event()
+        future = self._pool.submit(self._run, job_id, repo_url, incremental, revision)
+        self._futures[job_id] = future
+        # cleanup runs after the assignment above even if the job already
+        # finished (the callback then fires right here)
+        future.add_done_callback(lambda f: self._forget(job_id, f))
+
+    def _forget(self, job_id: str, future) -> None:
+        if self._futures.get(job_id) is future:
+            self._futures.pop(job_id, None)
+            self._cancel_events.pop(job_id, None)
+
+    def _run(self, job_id: str, repo_url: str, incremental: bool, revision: str = None) -> None:
+        cancel = self._cancel_events[job_id]
+        progress_state = {}
+
+        def progress(stage: str, **counters):
+            if cancel.is_set():
+                raise IngestCancelled()
+            progress_state.update(counters)
+            self._update(job_id, stage=stage, progress=json.dumps(progress_state))
+
+        try:
+            self._update(job_id, status="running")
+            result = ingest_repo_service(repo_url, incremental, progress=progress, revision=revision)
+            self._update(job_id, status="succeeded", stage="done", result=json.dumps(result))
+        except IngestCancelled:
+            self._update(job_id, status="cancelled")
+        except Exception as e:
+            self._update(job_id, status="failed", error=str(e))
+
+    def status(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, repo_url, revision, status, stage, progress, result, error, "
+                "created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ["job_id", "repo_url", "revision", "status", "stage", "progress", "result", "error",
+                "created_at", "updated_at"]
+        job = dict(zip(keys, row))
+        job["progress"] = json.loads(job["progress"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Queued jobs are dropped; running jobs stop at their next progress
+        report (between batches). Returns False if the job isn't active.
+        """
+        future = self._futures.get(job_id)
+        if future is None or future.done():
+            return False
+        if future.cancel():
+            # the done callback forgets the future
+            self._update(job_id, status="cancelled")
+            return True
+        event = self._cancel_events.get(job_id)
+        if event is not None:
+            event.set()
+        return True
+
+    def shutdown(self) -> None:
+        for event in list(self._cancel_events.values()):
+            event.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+@lru_cache(maxsize=1)
+def get_job_queue() -> JobQueue:
+    return JobQueue()
@@ -0,0 +1,38 @@
+import json
+from pathlib import Path
+from config import CLONE_BASE
+
+
+def manifest_path(repo_id: str) -> Path:
+    return Path(CLONE_BASE) / f"{repo_id}.manifest.json"
+
+
+def load_manifest(repo_id: str) -> dict:
+    """
+    Manifest layout:
+      {"commit": "<sha>", "files": {"<rel path>": {"sha": "<blob sha>", "nodes": [node ids]}}}
+    """
+    path = manifest_path(repo_id)
+    if not path.exists():
+        return {"commit": None, "files": {}}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_manifest(repo_id: str, manifest: dict) -> None:
+    path = manifest_path(repo_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest), encoding="utf-8")
+    tmp.replace(path)
+
+
+def diff_manifest(manifest: dict, blobs: dict) -> tuple[list, list, list]:
+    """
+    Compares the stored manifest to the current tree.
+    Returns (added, modified, removed) relative paths.
+    """
+    old = manifest["files"]
+    added = [p for p in blobs if p not in old]
+    modified = [p for p in blobs if p in old and old[p]["sha"] != blobs[p]]
+    removed = [p for p in old if p not in blobs]
+    return added, modified, removed
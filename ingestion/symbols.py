@@ -0,0 +1,150 @@
+"""
+Symbol table built at ingest: modules, classes, functions and methods with
+their line spans and the chunks covering them, stored in Postgres so a
+named symbol resolves with a btree lookup.
+"""
+from sqlalchemy import text
+
+from .vector_store import SCHEMA_NAME, get_engine, get_async_engine
+
+SYMBOL_TABLE = f'"{SCHEMA_NAME}"."code_symbols"'
+
+_DEFINITIONS = {"class_definition": "class", "function_definition": "function"}
+
+
+def _module_name(rel_path: str) -> str:
+    mod = rel_path[:-3] if rel_path.endswith(".py") else rel_path
+    if mod.endswith("/__init__"):
+        mod = mod[: -len("/__init__")]
+    return mod.replace("/", ".")
+
+
+def extract_symbols(tree, source: bytes, rel_path: str) -> list:
+    """
+    Walks a tree-sitter Python tree. Line numbers are 1-based, inclusive.
+    """
+    module = _module_name(rel_path)
+    symbols = [{
+        "name": module.rsplit(".", 1)[-1],
+        "qualname": module,
+        "kind": "module",
+        "file_path": rel_path,
+        "start_line": 1,
+        "end_line": source.count(b"\n") + 1,
+    }]
+
+    def visit(node, scope, in_class):
+        kind = _DEFINITIONS.get(node.type)
+        if kind is not None:
+            name_node = node.child_by_field_name("name")
+            name = source[name_node.start_byte:name_node.end_byte].decode("utf-8", "replace")
+            qualname = ".".join(scope + [name])
+            symbols.append({
+                "name": name,
+                "qualname": f"{module}.{qualname}",
+                "kind": "method" if kind == "function" and in_class else kind,
+                "file_path": rel_path,
+                "start_line": node.start_point[0] + 1,
+                "end_line": node.end_point[0] + 1,
+            })
+            body = node.child_by_field_name("body")
+            if body is not None:
+                for child in body.children:
+                    visit(child, scope + [name], kind == "class")
+            return
+        for child in node.children:
+            visit(child, scope, in_class)
+
+    visit(tree.root_node, [], False)
+    return symbols
+
+
+def attach_chunk_ids(symbols: list, nodes: list) -> None:
+    """
+    chunk_ids: every chunk whose line range overlaps the symbol's span, the
+    one holding the definition line first.
+    """
+    spans = [
+        (n.metadata.get("start_line"), n.metadata.get("end_line"), n.node_id)
+        for n in nodes
+        if n.metadata.get("start_line") is not None
+    ]
+    for sym in symbols:
+        covering = sorted(
+            (start, node_id) for start, end, node_id in spans
+            if start <= sym["end_line"] and end >= sym["start_line"]
+        )
+        # latest chunk starting at or before the definition line contains it
+        defining = [nid for start, nid in covering if start <= sym["start_line"]][-1:]
+        sym["chunk_ids"] = defining + [nid for _, nid in covering if nid not in defining]
+
+
+def ensure_symbol_table() -> None:
+    with get_engine().begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {SYMBOL_TABLE} ("
+            " id BIGSERIAL PRIMARY KEY, repo_id TEXT NOT NULL, name TEXT NOT NULL,"
+            " qualname TEXT NOT NULL, kind TEXT NOT NULL, file_path TEXT NOT NULL,"
+            " start_line INT NOT NULL, end_line INT NOT NULL, chunk_ids TEXT[] NOT NULL)"
+        ))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS code_symbols_repo_name_idx ON {SYMBOL_TABLE} (repo_id, name)"
+        ))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS code_symbols_repo_qualname_idx ON {SYMBOL_TABLE} (repo_id, qualname)"
+        ))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS code_symbols_repo_path_idx ON {SYMBOL_TABLE} (repo_id, file_path)"
+        ))
+
+
+def replace_symbols(repo_id: str, file_paths: list, symbols: list) -> None:
+    """
+    Drops the rows for `file_paths` and inserts `symbols` in one transaction.
+    """
+    with get_engine().begin() as conn:
+        if file_paths:
+            conn.execute(
+                text(f"DELETE FROM {SYMBOL_TABLE} WHERE repo_id = :repo_id AND file_path = ANY(:paths)"),
+                {"repo_id": repo_id, "paths": list(file_paths)},
+            )
+        if symbols:
+            conn.execute(
+                text(
+                    f"INSERT INTO {SYMBOL_TABLE} "
+                    "(repo_id, name, qualname, kind, file_path, start_line, end_line, chunk_ids) "
+                    "VALUES (:repo_id, :name, :qualname, :kind, :file_path, :start_line, :end_line, :chunk_ids)"
+                ),
+                [{**s, "repo_id": repo_id} for s in symbols],
+            )
+
+
+def _lookup_sql(names, repo_id, limit):
+    where = "(name = ANY(:names) OR qualname = ANY(:names))"
+    params = {"names": list(names), "limit": limit}
+    if repo_id:
+        where += " AND repo_id = :repo_id"
+        params["repo_id"] = repo_id
+    sql = text(
+        f"SELECT repo_id, name, qualname, kind, file_path, start_line, end_line, chunk_ids "
+        f"FROM {SYMBOL_TABLE} WHERE {where} "
+        # classes/functions before modules, exact qualname matches first
+        "ORDER BY (qualname = ANY(:names)) DESC, (kind = 'module'), qualname LIMIT :limit"
+    )
+    return sql, params
+
+
+def lookup_symbols(names, repo_id: str = None, limit: int = 10) -> list:
+    if not names:
+        return []
+    sql, params = _lookup_sql(names, repo_id, limit)
+    with get_engine().connect() as conn:
+        return [dict(r) for r in conn.execute(sql, params).mappings().all()]
+
+
+async def alookup_symbols(names, repo_id: str = None, limit: int = 10) -> list:
+    if not names:
+        return []
+    sql, params = _lookup_sql(names, repo_id, limit)
+    async with get_async_engine().connect() as conn:
+        return [dict(r) for r in (await conn.execute(sql, params)).mappings().all()]
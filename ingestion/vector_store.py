@@ -1,14 +1,96 @@
+from functools import lru_cache
 from llama_index.vector_stores.postgres import PGVectorStore
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import create_async_engine
 
+PG_PARAMS = {
+    "host": "localhost",
+    "port": 5432,
+    "user": "postgres",
+    "password": "postgres",
+    "database": "llama_db",
+}
+SCHEMA_NAME = "public"
+TABLE_NAME = "public_repo"
+EMBED_DIM = 1024  # Embedding dimension for the model being used
+# PGVectorStore prefixes its table with "data_"
+DATA_TABLE = f'"{SCHEMA_NAME}"."data_{TABLE_NAME}"'
+
+
+@lru_cache(maxsize=1)
 def get_pg_store():
     return PGVectorStore.from_params(
-        host="localhost",
-        port=5432,
-        user="postgres",
-        password="postgres",
-        database="llama_db",
-        table_name="public_repo",
-        schema_name="public",
-        embed_dim=1024,    # Embedding dimension for the model being used
+        **PG_PARAMS,
+        table_name=TABLE_NAME,
+        schema_name=SCHEMA_NAME,
+        embed_dim=EMBED_DIM,
         hybrid_search=False
     )
+
+
+def _db_url(driver: str) -> URL:
+    return URL.create(
+        driver,
+        username=PG_PARAMS["user"],
+        password=PG_PARAMS["password"],
+        host=PG_PARAMS["host"],
+        port=PG_PARAMS["port"],
+        database=PG_PARAMS["database"],
+    )
+
+
+@lru_cache(maxsize=1)
+def get_engine():
+    """
+    Plain SQLAlchemy engine on the same database, for the queries the
+    llama-index store doesn't expose (filtered search, index DDL).
+    """
+    return create_engine(_db_url("postgresql+psycopg2"), pool_pre_ping=True)
+
+
+@lru_cache(maxsize=1)
+def get_async_engine():
+    return create_async_engine(_db_url("postgresql+asyncpg"), pool_pre_ping=True)
+
+
+def ensure_metadata_index():
+    """
+    Indexes backing the per-repo filter (repo_id equality, file_path prefix)
+    and lookups by node_id.
+    """
+    get_pg_store()._initialize()
+    with get_engine().begin() as conn:
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS data_{TABLE_NAME}_repo_path_idx ON {DATA_TABLE} "
+            "((metadata_->>'repo_id'), (metadata_->>'file_path') text_pattern_ops)"
+        ))
+        # node_id lookups: symbol hits, manifest deletes
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS data_{TABLE_NAME}_node_id_idx ON {DATA_TABLE} (node_id)"
+        ))
+
+
+def ensure_text_search_index():
+    """
+    GIN index for the lexical half of hybrid retrieval. 'simple' keeps
+    identifiers unstemmed, which is what code search wants.
+    """
+    get_pg_store()._initialize()
+    with get_engine().begin() as conn:
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS data_{TABLE_NAME}_text_tsv_idx ON {DATA_TABLE} "
+            "USING gin (to_tsvector('simple', text))"
+        ))
+
+
+def delete_repo_rows(repo_id: str) -> int:
+    """
+    Drops every row stored for repo_id, whether or not a manifest lists it.
+    """
+    with get_engine().begin() as conn:
+        result = conn.execute(
+            text(f"DELETE FROM {DATA_TABLE} WHERE metadata_->>'repo_id' = :repo_id"),
+            {"repo_id": repo_id},
+        )
+    return result.rowcount
@@ -0,0 +1,60 @@
+"""
+Process-wide resources shared by every request.
+
+The getters themselves are cached (one instance per process); warm_up() just
+touches them all once at startup so the first request doesn't pay for model
+loading, and is_ready() tells the readiness probe when that has finished
+(warm_up_error() when it failed instead).
+"""
+import logging
+import threading
+
+from ingestion.embedder import get_embedder, get_tokenizer, get_embed_cache
+from ingestion.vector_store import get_pg_store
+from generation.groq_client import get_llm, get_response_cache
+from generation.context_builder import get_context_tokenizer
+from generation.hybrid import get_reranker
+
+logger = logging.getLogger(__name__)
+
+_ready = threading.Event()
+_error = None
+
+
+def warm_up() -> None:
+    global _error
+    _error = None
+    try:
+        _warm_up()
+    except Exception as e:
+        # runs in a fire-and-forget task; without this the failure is silent
+        # and /ready stays at 503 with no explanation
+        logger.exception("Warm-up failed")
+        _error = f"{type(e).__name__}: {e}"
+
+
+def _warm_up() -> None:
+    logger.info("Warming up shared resources...")
+    embedder = get_embedder()
+    # first forward pass triggers lazy init (threads, kernels)
+    embedder.get_query_embedding("warm up")
+    get_tokenizer()
+    get_context_tokenizer()
+    get_reranker()
+    get_embed_cache()
+    get_pg_store()
+    get_llm()
+    get_response_cache()
+    _ready.set()
+    logger.info("Shared resources ready")
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def warm_up_error():
+    """
+    Why warm-up failed, or None if it succeeded or is still running.
+    """
+    return _error
@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from generation.llm_cache import ResponseCache, SingleFlight, AsyncSingleFlight, response_key
+
+
+def test_response_cache_roundtrip_invalidate_and_eviction(tmp_path):
+    cache = ResponseCache(str(tmp_path / "llm.sqlite"), max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.invalidate("a")
+    assert cache.get("a") is None
+
+    cache.put("c", "3")
+    cache.put("d", "4")
+    # least recently used entry goes first
+    assert cache.get("b") is None
+    assert cache.get("d") == "4"
+
+
+def test_response_key_depends_on_every_part():
+    base = response_key("m", "sys", "user", 0)
+    assert base == response_key("m", "sys", "user", 0)
+    assert base != response_key("m2", "sys", "user", 0)
+    assert base != response_key("m", "sys2", "user", 0)
+    assert base != response_key("m", "sys", "user2", 0)
+    assert base != response_key("m", "sys", "user", 0.5)
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(calls) == 1
+    assert results == ["result"] * 5
+
+
+def test_async_single_flight_coalesces_concurrent_calls():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*[flight.do("k", slow) for _ in range(5)])
+
+    assert asyncio.run(main()) == ["result"] * 5
+    assert len(calls) == 1
+
+
+class StubLLM:
+    """
+    Stands in for the Groq client: returns the queued responses in order.
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        return SimpleNamespace(message=SimpleNamespace(content=self.responses.pop(0)))
+
+    def chat(self, messages):
+        return self._next()
+
+    async def achat(self, messages):
+        return self._next()
+
+
+@pytest.fixture
+def groq_client(monkeypatch, tmp_path):
+    """
+    generation.groq_client with a temporary response cache. Tests using it
+    are skipped unless python-dotenv and llama-index-llms-groq are installed.
+    """
+    pytest.importorskip("dotenv")
+    pytest.importorskip("llama_index.llms.groq")
+    monkeypatch.setenv("DATABASE_URL", "postgresql://localhost/test")
+    monkeypatch.setenv("GROQ_API_KEY", "test")
+    from generation import groq_client
+
+    cache = ResponseCache(str(tmp_path / "llm.sqlite"), max_entries=10)
+    monkeypatch.setattr(groq_client, "get_response_cache", lambda: cache)
+    return groq_client
+
+
+def test_call_groq_caches_only_valid_responses(groq_client, monkeypatch):
+    from generation.test_generator import _is_json
+
+    llm = StubLLM(["not json", '{"a.robot": "ok"}'])
+    monkeypatch.setattr(groq_client, "get_llm", lambda: llm)
+
+    assert groq_client.call_groq("sys", "user", validate=_is_json) == "not json"
+    # the invalid response wasn't cached, so this goes to the model again
+    assert groq_client.call_groq("sys", "user", validate=_is_json) == '{"a.robot": "ok"}'
+    # and this one is served from the cache
+    assert groq_client.call_groq("sys", "user", validate=_is_json) == '{"a.robot": "ok"}'
+    assert llm.calls == 2
+
+
+def test_acall_groq_coalesces_identical_calls(groq_client, monkeypatch):
+    llm = StubLLM(['{"a.robot": "ok"}'])
+    monkeypatch.setattr(groq_client, "get_llm", lambda: llm)
+
+    async def main():
+        return await asyncio.gather(*[groq_client.acall_groq("sys", "user") for _ in range(3)])
+
+    assert asyncio.run(main()) == ['{"a.robot": "ok"}'] * 3
+    assert llm.calls == 1
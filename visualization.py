@@ -9,81 +9,271 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import plotly.express as px
 import plotly.graph_objects as go
-from sklearn.decomposition import PCA
-from sklearn.manifold import TSNE
 from typing import List, Optional, Tuple
 import logging
+import os
+
+from embedding_reduction import ReductionEngine
+from embedding_similarity import (
+    BLOCK_ROWS, DUPLICATE_THRESHOLD, top_k_neighbors, duplicate_clusters, duplicate_report,
+    heatmap_sample,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Lines parsed per np.fromstring call when reading a text embedding dump
+LOAD_CHUNK_ROWS = 10000
+# Rows per round trip when streaming embeddings out of Postgres
+DB_FETCH_ROWS = 10000
+
+
+def _vector_text(line: str) -> str:
+    """
+    Returns the comma-separated body of the bracketed vector on a dump line,
+    ignoring CSV quoting and any metadata columns after it.
+    """
+    start = line.find('[')
+    end = line.find(']', start + 1)
+    if start < 0 or end < 0:
+        raise ValueError(f"No bracketed vector in line: {line[:80]!r}")
+    return line[start + 1:end]
+
+
+def _parse_vector_chunk(lines: List[str], dim: int) -> np.ndarray:
+    # one C-level parse for the whole chunk instead of json.loads per row
+    flat = np.fromstring(','.join(_vector_text(line) for line in lines), dtype=np.float32, sep=',')
+    if flat.size != len(lines) * dim:
+        raise ValueError(f"Ragged embeddings: expected {dim} values per row")
+    return flat.reshape(len(lines), dim)
+
+
+def _iter_line_chunks(filepath: str, chunk_rows: int):
+    with open(filepath) as fh:
+        chunk = []
+        for line in fh:
+            if not line.strip():
+                continue
+            chunk.append(line)
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
 
 class EmbeddingVisualizer:
     """
     Class to handle visualization of embedding data from vector database.
     """
     
-    def __init__(self, vector_store=None):
+    def __init__(self, vector_store=None, reduction_cache_dir: Optional[str] = None):
         """
         Initialize the visualizer with optional vector store connection.
         
         Args:
             vector_store: Vector store instance to query embeddings from
+            reduction_cache_dir: Optional directory to persist PCA/t-SNE fits in
         """
         self.vector_store = vector_store
+        self.reducer = ReductionEngine(cache_dir=reduction_cache_dir)
+        self.embeddings = None  # (n, dim) float32 array, possibly memory-mapped
         self.embeddings_df = None
+        self.metadata_df = None  # one row per embedding, when loaded from the db
         self.reduced_embeddings = None
+        self.neighbor_indices = None  # (n, k) nearest rows, see find_neighbors
+        self.neighbor_scores = None
+
+    def _set_embeddings(self, embeddings: np.ndarray) -> None:
+        self.embeddings = embeddings
+        # a view over the same buffer, kept for callers that want a frame
+        self.embeddings_df = pd.DataFrame(embeddings, copy=False)
+
+    def _embedding_matrix(self) -> np.ndarray:
+        if self.embeddings is None:
+            raise ValueError("No embeddings loaded. Call load_embeddings first.")
+        return self.embeddings
     
-    def load_embeddings_from_db(self) -> pd.DataFrame:
+    def load_embeddings_from_db(self, repo_id: Optional[str] = None, limit: Optional[int] = None,
+                                sample_percent: Optional[float] = None, sample_method: str = 'bernoulli',
+                                seed: int = 42, batch_size: int = DB_FETCH_ROWS) -> pd.DataFrame:
         """
         Load embeddings from the vector database.
         
+        Rows are streamed through a server-side cursor, `batch_size` at a
+        time, and each batch's vectors are parsed straight into a
+        preallocated float32 array; node_id, repo_id, file_path and line
+        range go to `self.metadata_df`. Filtering, sampling and the limit all
+        happen in SQL, so only the selected rows leave the database.
+        
+        Args:
+            repo_id: Only load chunks of this repo (see ingestion.clone.repo_id_for)
+            limit: Maximum number of rows
+            sample_percent: Random sample of the table, in percent (TABLESAMPLE)
+            sample_method: 'bernoulli' (row-level) or 'system' (block-level, faster
+                on huge tables but clustered by insertion order)
+            seed: TABLESAMPLE REPEATABLE seed, so a sample can be reproduced
+            batch_size: Rows fetched per round trip
+            
         Returns:
             DataFrame containing embeddings and metadata
         """
-        # TODO: Implement database query logic
+        import psycopg2
+        from ingestion.vector_store import PG_PARAMS, DATA_TABLE
+        
         logger.info("Loading embeddings from vector database...")
-        pass
+        
+        from_clause = DATA_TABLE
+        params = []
+        if sample_percent is not None:
+            if sample_method.lower() not in ('bernoulli', 'system'):
+                raise ValueError("sample_method must be 'bernoulli' or 'system'")
+            from_clause += f" TABLESAMPLE {sample_method.upper()} (%s) REPEATABLE (%s)"
+            params += [sample_percent, seed]
+        where = ""
+        if repo_id is not None:
+            where = "WHERE metadata_->>'repo_id' = %s"
+            params.append(repo_id)
+        
+        conn = psycopg2.connect(**PG_PARAMS)
+        try:
+            # sizes the array up front; with REPEATABLE the count sees the same sample
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT COUNT(*) FROM {from_clause} {where}", params)
+                expected = cur.fetchone()[0]
+            if limit is not None:
+                expected = min(expected, limit)
+            
+            limit_clause = "LIMIT %s" if limit is not None else ""
+            with conn.cursor(name='embedding_export') as cur:
+                cur.itersize = batch_size
+                cur.execute(
+                    "SELECT node_id, metadata_->>'repo_id', metadata_->>'file_path', "
+                    "metadata_->>'start_line', metadata_->>'end_line', CAST(embedding AS text) "
+                    f"FROM {from_clause} {where} {limit_clause}",
+                    params + ([limit] if limit is not None else []),
+                )
+                embeddings = None
+                meta = []
+                n_rows = 0
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    if embeddings is None:
+                        dim = _vector_text(rows[0][5]).count(',') + 1
+                        embeddings = np.empty((max(expected, len(rows)), dim), dtype=np.float32)
+                    if n_rows + len(rows) > embeddings.shape[0]:
+                        # rows inserted since the count; grow rather than fail
+                        embeddings.resize((max(n_rows + len(rows), int(embeddings.shape[0] * 1.5)),
+                                           embeddings.shape[1]), refcheck=False)
+                    embeddings[n_rows:n_rows + len(rows)] = _parse_vector_chunk([r[5] for r in rows], dim)
+                    meta.extend(r[:5] for r in rows)
+                    n_rows += len(rows)
+            conn.rollback()
+        finally:
+            conn.close()
+        
+        if embeddings is None:
+            raise ValueError("No embeddings found in the vector database for this selection")
+        if n_rows < embeddings.shape[0]:
+            embeddings.resize((n_rows, embeddings.shape[1]), refcheck=False)
+        
+        self._set_embeddings(embeddings)
+        self.metadata_df = pd.DataFrame(meta, columns=['node_id', 'repo_id', 'file_path', 'start_line', 'end_line'])
+        for col in ('start_line', 'end_line'):
+            self.metadata_df[col] = pd.to_numeric(self.metadata_df[col], errors='coerce').astype('Int64')
+        
+        logger.info(f"Loaded {n_rows} embeddings with {embeddings.shape[1]} dimensions")
+        return self.embeddings_df
     
-    def load_embeddings_from_file(self, filepath: str) -> pd.DataFrame:
+    def load_embeddings_from_file(self, filepath: str, use_sidecar: bool = True,
+                                  chunk_rows: int = LOAD_CHUNK_ROWS) -> pd.DataFrame:
         """
-        Load embeddings from a file (CSV/TSV).
+        Load embeddings from a file (CSV/TSV, or a .npy array).
+        
+        Text dumps hold one bracketed vector per line in the first column.
+        They are parsed in chunks of `chunk_rows` lines straight into a
+        float32 array, so memory stays at the size of the result. With
+        `use_sidecar`, that array is written to `<filepath>.npy` and later
+        loads memory-map the sidecar instead of re-parsing, as long as it is
+        newer than the text file.
         
         Args:
             filepath: Path to the embeddings file
+            use_sidecar: Read/write the `.npy` sidecar next to a text dump
+            chunk_rows: Lines parsed per chunk
             
         Returns:
             DataFrame containing embeddings and metadata
         """
         logger.info(f"Loading embeddings from file: {filepath}")
         
-        if filepath.endswith('.tsv'):
-            df = pd.read_csv(filepath, sep='\t', header=None)
-        elif filepath.endswith('.csv'):
-            df = pd.read_csv(filepath, header=None)
+        if filepath.endswith('.npy'):
+            embeddings = np.load(filepath, mmap_mode='r')
+        elif filepath.endswith(('.tsv', '.csv')):
+            sidecar = filepath + '.npy'
+            if use_sidecar and os.path.exists(sidecar) \
+                    and os.path.getmtime(sidecar) >= os.path.getmtime(filepath):
+                logger.info(f"Using sidecar {sidecar}")
+                embeddings = np.load(sidecar, mmap_mode='r')
+            else:
+                embeddings = self._parse_text_dump(filepath, sidecar if use_sidecar else None, chunk_rows)
         else:
-            raise ValueError("Unsupported file format. Use CSV or TSV.")
-        
-        # Parse the embedding strings into arrays
-        import json
-        embeddings_list = []
-        for idx, row in df.iterrows():
-            # Get the first column which contains the embedding string
-            embedding_str = row[0]
-            # Parse the string as a JSON array
-            embedding = json.loads(embedding_str)
-            embeddings_list.append(embedding)
-        
-        # Convert to DataFrame with separate columns for each dimension
-        self.embeddings_df = pd.DataFrame(embeddings_list)
-        
-        logger.info(f"Loaded {len(self.embeddings_df)} embeddings with {self.embeddings_df.shape[1]} dimensions")
+            raise ValueError("Unsupported file format. Use CSV, TSV or NPY.")
+        
+        self._set_embeddings(embeddings)
+        
+        logger.info(f"Loaded {embeddings.shape[0]} embeddings with {embeddings.shape[1]} dimensions")
         return self.embeddings_df
     
+    @staticmethod
+    def _parse_text_dump(filepath: str, sidecar: Optional[str], chunk_rows: int) -> np.ndarray:
+        """
+        Two passes over the text dump: count rows and read the dimension, then
+        parse chunk by chunk into a preallocated array (a memory-mapped .npy
+        file when `sidecar` is given, so it never has to fit in RAM).
+        """
+        n_rows = 0
+        dim = None
+        with open(filepath) as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                if dim is None:
+                    dim = _vector_text(line).count(',') + 1
+                n_rows += 1
+        if dim is None:
+            raise ValueError(f"No embeddings in {filepath}")
+        
+        if sidecar:
+            # written under a temporary name so a crash never leaves a
+            # truncated sidecar that looks newer than the dump
+            tmp_path = sidecar + '.tmp.npy'
+            out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(n_rows, dim))
+        else:
+            out = np.empty((n_rows, dim), dtype=np.float32)
+        
+        row = 0
+        for lines in _iter_line_chunks(filepath, chunk_rows):
+            out[row:row + len(lines)] = _parse_vector_chunk(lines, dim)
+            row += len(lines)
+        
+        if not sidecar:
+            return out
+        out.flush()
+        del out
+        os.replace(tmp_path, sidecar)
+        logger.info(f"Wrote sidecar {sidecar}")
+        return np.load(sidecar, mmap_mode='r')
+    
     def reduce_dimensions(self, method: str = 'pca', n_components: int = 2) -> np.ndarray:
         """
         Reduce dimensionality of embeddings for visualization.
         
+        Fits are cached per dataset (see ReductionEngine), so asking for 3D
+        after 2D, or t-SNE after PCA, reuses the same PCA fit.
+        
         Args:
             method: 'pca' or 'tsne'
             n_components: Number of dimensions to reduce to (2 or 3)
@@ -91,27 +281,27 @@ class EmbeddingVisualizer:
         Returns:
             Reduced embeddings array
         """
-        if self.embeddings_df is None:
-            raise ValueError("No embeddings loaded. Call load_embeddings first.")
-        
-        # Extract embedding columns (assuming they're numeric)
-        embedding_cols = self.embeddings_df.select_dtypes(include=[np.number]).columns
-        embeddings = self.embeddings_df[embedding_cols].values
+        embeddings = self._embedding_matrix()
         
         logger.info(f"Reducing dimensions using {method}...")
-        
-        if method.lower() == 'pca':
-            reducer = PCA(n_components=n_components)
-            self.reduced_embeddings = reducer.fit_transform(embeddings)
-            logger.info(f"Explained variance: {reducer.explained_variance_ratio_}")
-        elif method.lower() == 'tsne':
-            reducer = TSNE(n_components=n_components, random_state=42)
-            self.reduced_embeddings = reducer.fit_transform(embeddings)
-        else:
-            raise ValueError("Method must be 'pca' or 'tsne'")
-        
+        self.reduced_embeddings = self.reducer.reduce(embeddings, method=method, n_components=n_components)
         return self.reduced_embeddings
     
+    def project_embeddings(self, new_embeddings: np.ndarray, method: str = 'pca',
+                           n_components: int = 2) -> np.ndarray:
+        """
+        Place newly ingested embeddings into the existing layout without refitting.
+        
+        Args:
+            new_embeddings: (m, dim) array of new embeddings
+            method: Method of the layout to project into ('pca' or 'tsne')
+            n_components: Dimensions of that layout
+            
+        Returns:
+            (m, n_components) coordinates, comparable with reduced_embeddings
+        """
+        return self.reducer.project(new_embeddings, method=method, n_components=n_components)
+    
     def plot_2d_static(self, labels: Optional[List] = None, title: str = "Embedding Visualization",
                       save_path: Optional[str] = None):
         """
@@ -258,29 +448,70 @@ class EmbeddingVisualizer:
         
         fig.show()
     
-    def plot_heatmap(self, sample_size: int = 50, title: str = "Embedding Similarity Heatmap",
-                    save_path: Optional[str] = None):
+    def find_neighbors(self, k: int = 10, block_rows: int = BLOCK_ROWS) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top-k cosine neighbours of every embedding, computed in tiles
+        with bounded memory (see embedding_similarity.top_k_neighbors).
+        
+        Args:
+            k: Neighbours per embedding
+            block_rows: Rows per tile
+            
+        Returns:
+            (indices, scores), both (n, k), most similar first
+        """
+        embeddings = self._embedding_matrix()
+        logger.info(f"Finding top-{k} neighbours for {embeddings.shape[0]} embeddings...")
+        self.neighbor_indices, self.neighbor_scores = top_k_neighbors(embeddings, k=k, block_rows=block_rows)
+        return self.neighbor_indices, self.neighbor_scores
+    
+    def duplicate_report(self, threshold: float = DUPLICATE_THRESHOLD, k: int = 10) -> pd.DataFrame:
+        """
+        Clusters of near-duplicate chunks: embeddings linked by a neighbour
+        similarity of at least `threshold`.
+        
+        Args:
+            threshold: Cosine similarity at which two chunks count as duplicates
+            k: Neighbours to compute if find_neighbors hasn't run yet
+            
+        Returns:
+            DataFrame with one row per duplicate chunk (cluster, cluster_size,
+            row, plus metadata_df columns when loaded from the db)
+        """
+        if self.neighbor_indices is None:
+            self.find_neighbors(k=k)
+        clusters = duplicate_clusters(self.neighbor_indices, self.neighbor_scores, threshold)
+        report = duplicate_report(clusters, self.metadata_df)
+        logger.info(f"{len(clusters)} duplicate clusters covering {len(report)} chunks")
+        return report
+    
+    def plot_heatmap(self, sample_size: int = 200, title: str = "Embedding Similarity Heatmap",
+                    save_path: Optional[str] = None, threshold: float = DUPLICATE_THRESHOLD):
         """
         Create heatmap showing similarity between embeddings.
         
+        The full set is too large to draw, so a sample is shown: members of
+        near-duplicate clusters (once find_neighbors has run) plus random
+        rows, ordered by hierarchical clustering so similar chunks sit
+        together.
+        
         Args:
-            sample_size: Number of embeddings to include (for performance)
+            sample_size: Number of embeddings to include
             title: Plot title
             save_path: Optional path to save the figure (e.g., 'heatmap.png')
+            threshold: Duplicate threshold used to pick cluster members
         """
-        if self.embeddings_df is None:
-            raise ValueError("No embeddings loaded. Call load_embeddings first.")
-        
-        embedding_cols = self.embeddings_df.select_dtypes(include=[np.number]).columns
-        embeddings = self.embeddings_df[embedding_cols].values[:sample_size]
+        embeddings = self._embedding_matrix()
         
-        # Compute cosine similarity
-        from sklearn.metrics.pairwise import cosine_similarity
-        similarity_matrix = cosine_similarity(embeddings)
+        clusters = None
+        if self.neighbor_indices is not None:
+            clusters = duplicate_clusters(self.neighbor_indices, self.neighbor_scores, threshold)
+        _, similarity_matrix = heatmap_sample(embeddings, sample_size, clusters)
         
         plt.figure(figsize=(12, 10))
         sns.heatmap(similarity_matrix, cmap='coolwarm', center=0, 
-                   square=True, linewidths=0.5, cbar_kws={"shrink": 0.8})
+                   square=True, linewidths=0.5 if len(similarity_matrix) <= 50 else 0,
+                   cbar_kws={"shrink": 0.8})
         plt.title(title)
         plt.tight_layout()
         
@@ -300,6 +531,8 @@ def main():
     
     # Load embeddings from file
     # visualizer.load_embeddings_from_file('embeddings.tsv')
+    # or straight from pgvector, e.g. a 10% sample of one repo:
+    # visualizer.load_embeddings_from_db(repo_id='<repo_id>', sample_percent=10)
     
     # Reduce dimensions
     # visualizer.reduce_dimensions(method='pca', n_components=2)
@@ -308,6 +541,7 @@ def main():
     # visualizer.plot_2d_static()
     # visualizer.plot_2d_interactive()
     # visualizer.plot_3d_interactive()
+    # visualizer.duplicate_report()
     # visualizer.plot_heatmap()
     
     logger.info("Visualization module ready")